@@ -0,0 +1,263 @@
+"""
+Online database backups
+Snapshots are taken with VACUUM INTO: one read transaction, which in WAL mode does not hold up
+writers and is not restarted by them. Snapshots are stored gzip-compressed, can be restored while
+the API is stopped, and reviews created since the last export can be exported on their own.
+
+Usage:
+    python backup.py backup
+    python backup.py restore <snapshot.db.gz>
+    python backup.py export-reviews
+    python backup.py list
+"""
+
+import fcntl
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+BACKUP_DIR = os.getenv("BACKUP_DIR", "./backups")
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))  # Snapshots kept; older ones are pruned
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+MANIFEST_FILE = "manifest.json"
+
+_in_use_lock = None
+
+
+def database_path() -> str:
+    """Filesystem path of the SQLite database behind the engine"""
+    if engine.dialect.name != "sqlite" or not engine.url.database:
+        raise RuntimeError("Online backups are only supported for file-based SQLite databases")
+    return os.path.abspath(engine.url.database)
+
+
+def _in_use_path() -> str:
+    return database_path() + ".in-use"
+
+
+def hold_database():
+    """
+    Mark the database as in use by this process until it exits
+
+    Every API process holds a shared lock; restore needs the exclusive one, so it refuses to
+    overwrite the database under a running API.
+    """
+    global _in_use_lock
+    if _in_use_lock is not None:
+        return
+    lock_file = open(_in_use_path(), "w")
+    fcntl.flock(lock_file, fcntl.LOCK_SH)
+    _in_use_lock = lock_file
+
+
+def _load_manifest() -> Dict[str, Any]:
+    path = os.path.join(BACKUP_DIR, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"snapshots": [], "exports": [], "last_exported_review_id": 0}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest: Dict[str, Any]):
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    path = os.path.join(BACKUP_DIR, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def _timestamp() -> str:
+    return datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+
+
+def _gzip_file(source_path: str, target_path: str):
+    with open(source_path, "rb") as src, gzip.open(target_path + ".tmp", "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+    os.replace(target_path + ".tmp", target_path)
+
+
+def backup_database() -> str:
+    """Write a compressed snapshot of the live database; returns the snapshot path"""
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started = time.perf_counter()
+    snapshot_path = os.path.join(BACKUP_DIR, f"hotel_reviews-{_timestamp()}.db.gz")
+
+    temp_dir = tempfile.mkdtemp(dir=BACKUP_DIR)
+    temp_path = os.path.join(temp_dir, "snapshot.db")
+    try:
+        source = sqlite3.connect(database_path())
+        try:
+            # A stepped backup API copy restarts whenever another connection writes, so it may
+            # never finish under steady traffic; VACUUM INTO reads one consistent snapshot
+            source.execute("VACUUM INTO ?", (temp_path,))
+        finally:
+            source.close()
+        target = sqlite3.connect(temp_path)
+        try:
+            max_review_id = target.execute("SELECT COALESCE(MAX(id), 0) FROM reviews").fetchone()[0]
+        finally:
+            target.close()
+        _gzip_file(temp_path, snapshot_path)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    manifest = _load_manifest()
+    manifest["snapshots"].append({
+        "file": os.path.basename(snapshot_path),
+        "created_at": datetime.utcnow().isoformat(),
+        "max_review_id": max_review_id,
+        "size_bytes": os.path.getsize(snapshot_path),
+    })
+    # A full snapshot covers every review it contains
+    manifest["last_exported_review_id"] = max(manifest.get("last_exported_review_id", 0), max_review_id)
+    _prune_snapshots(manifest)
+    _save_manifest(manifest)
+
+    logger.info(f"Backup written to {snapshot_path} in {time.perf_counter() - started:.2f}s")
+    return snapshot_path
+
+
+def _prune_snapshots(manifest: Dict[str, Any]):
+    snapshots = manifest["snapshots"]
+    while len(snapshots) > BACKUP_KEEP:
+        old = snapshots.pop(0)
+        old_path = os.path.join(BACKUP_DIR, old["file"])
+        if os.path.exists(old_path):
+            os.remove(old_path)
+
+
+def restore_database(snapshot_path: str):
+    """
+    Replace the database contents with a snapshot (WARNING: overwrites current data)
+
+    The API must be stopped first: its processes hold the database's in-use lock and restore
+    raises RuntimeError rather than change the data under them.
+    """
+    lock_file = open(_in_use_path(), "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError("The database is in use by a running API process; stop it before restoring")
+    try:
+        _restore_from(snapshot_path)
+    finally:
+        lock_file.close()
+
+
+def _restore_from(snapshot_path: str):
+    fd, temp_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(snapshot_path)))
+    os.close(fd)
+    try:
+        with gzip.open(snapshot_path, "rb") as src, open(temp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        source = sqlite3.connect(temp_path)
+        target = sqlite3.connect(database_path())
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    # Pooled connections may hold pages from before the restore
+    engine.dispose()
+    logger.info(f"Database restored from {snapshot_path}")
+
+
+def export_new_reviews(since_id: Optional[int] = None) -> Optional[str]:
+    """
+    Export reviews created since the last backup or export as gzip JSON Lines
+
+    Reviews are read in id order, one chunk at a time, so the export never holds a long
+    read transaction. Returns the export path, or None when there is nothing new.
+    """
+    manifest = _load_manifest()
+    last_id = since_id if since_id is not None else manifest.get("last_exported_review_id", 0)
+    export_path = os.path.join(BACKUP_DIR, f"reviews-since-{last_id}-{_timestamp()}.jsonl.gz")
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+
+    exported = 0
+    source = sqlite3.connect(database_path())
+    source.row_factory = sqlite3.Row
+    try:
+        with gzip.open(export_path + ".tmp", "wt", encoding="utf-8") as out:
+            while True:
+                rows = source.execute(
+                    "SELECT * FROM reviews WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, EXPORT_CHUNK_SIZE)
+                ).fetchall()
+                if not rows:
+                    break
+                for row in rows:
+                    out.write(json.dumps(dict(row), default=str) + "\n")
+                exported += len(rows)
+                last_id = rows[-1]["id"]
+    finally:
+        source.close()
+
+    if exported == 0:
+        os.remove(export_path + ".tmp")
+        return None
+
+    os.replace(export_path + ".tmp", export_path)
+    manifest["exports"].append({
+        "file": os.path.basename(export_path),
+        "created_at": datetime.utcnow().isoformat(),
+        "reviews": exported,
+        "max_review_id": last_id,
+    })
+    manifest["last_exported_review_id"] = last_id
+    _save_manifest(manifest)
+    logger.info(f"Exported {exported} new reviews to {export_path}")
+    return export_path
+
+
+def list_backups() -> List[Dict[str, Any]]:
+    manifest = _load_manifest()
+    return manifest["snapshots"] + manifest["exports"]
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "backup":
+        path = backup_database()
+        print(f"✅ Database backed up to {path}")
+    elif command == "restore" and len(sys.argv) > 2:
+        print("⚠️  Restoring database - THIS WILL REPLACE ALL CURRENT DATA!")
+        try:
+            restore_database(sys.argv[2])
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print("✅ Database restored")
+    elif command == "export-reviews":
+        path = export_new_reviews()
+        print(f"✅ New reviews exported to {path}" if path else "No new reviews since the last backup")
+    elif command == "list":
+        for entry in list_backups():
+            print(f"  {entry['file']}  ({entry['created_at']})")
+    else:
+        print("Available commands:")
+        print("  python backup.py backup             - Compressed online snapshot of the database")
+        print("  python backup.py restore <file>     - Restore a snapshot with the API stopped (REPLACES ALL DATA)")
+        print("  python backup.py export-reviews     - Export reviews created since the last backup/export")
+        print("  python backup.py list               - List snapshots and exports")
@@ -0,0 +1,213 @@
+"""
+Hotel catalog loader
+Streams hotel catalogs in the data/hotels.json shape and upserts them in batched transactions
+keyed on the catalog's stable hotel id.
+
+Usage:
+    python catalog.py load [path]     (defaults to data/hotels.json)
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Hotel, HotelAmenity
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "hotels.json")
+CATALOG_BATCH_SIZE = int(os.getenv("CATALOG_BATCH_SIZE", "1000"))
+_READ_SIZE = 1024 * 1024
+_SEPARATORS = re.compile(r"[\s,]*")
+
+# Catalog columns written on insert and refreshed on update (sentiment aggregates are left alone)
+_CATALOG_COLUMNS = ("name", "location", "description", "category", "price_range", "phone", "email", "website")
+
+
+def iter_catalog(path: str = DEFAULT_CATALOG_PATH) -> Iterator[Dict[str, Any]]:
+    """
+    Yield hotel records one at a time without reading the whole file into memory
+
+    Accepts either an object with a top-level "hotels" array (the data/hotels.json shape)
+    or JSON Lines with one hotel per line.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+
+        def fill() -> bool:
+            # Drop what has been consumed and append the next chunk
+            nonlocal buffer, pos
+            chunk = f.read(_READ_SIZE)
+            if not chunk:
+                return False
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return True
+
+        # Find the start of the "hotels" array
+        while True:
+            key_pos = buffer.find('"hotels"')
+            if key_pos != -1:
+                bracket = buffer.find("[", key_pos)
+                if bracket != -1:
+                    pos = bracket + 1
+                    break
+            if not fill():
+                raise ValueError(f"No \"hotels\" array found in {path}")
+
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos >= len(buffer):
+                if not fill():
+                    raise ValueError(f"Unterminated \"hotels\" array in {path}")
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The record spans the chunk boundary; read more and retry
+                if not fill():
+                    raise
+                continue
+            yield record
+            pos = end
+
+
+def _hotel_row(record: Dict[str, Any]) -> Dict[str, Any]:
+    contact = record.get("contact") or {}
+    return {
+        "external_id": str(record["id"]),
+        "name": record.get("name", ""),
+        "location": record.get("location", ""),
+        "description": record.get("description", ""),
+        "category": record.get("category"),
+        "price_range": record.get("price_range"),
+        "phone": contact.get("phone"),
+        "email": contact.get("email"),
+        "website": contact.get("website"),
+    }
+
+
+def _upsert_hotels(db: Session, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Insert or update a batch of hotels; returns external_id -> hotel id"""
+    # Core statements with executemany: compiled once and cached, not once per row
+    conn = db.connection()
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(Hotel.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Hotel.__table__.c.external_id],
+            set_={column: stmt.excluded[column] for column in _CATALOG_COLUMNS}
+        )
+        conn.execute(stmt, [dict(row, average_sentiment=0.0, total_reviews=0) for row in rows])
+    else:
+        # Portable path: one lookup, then bulk update and bulk insert
+        existing = dict(conn.execute(
+            select(Hotel.external_id, Hotel.id).where(Hotel.external_id.in_([row["external_id"] for row in rows]))
+        ).all())
+        updates = [
+            dict({column: row[column] for column in _CATALOG_COLUMNS}, b_external_id=row["external_id"])
+            for row in rows if row["external_id"] in existing
+        ]
+        inserts = [
+            dict(row, average_sentiment=0.0, total_reviews=0)
+            for row in rows if row["external_id"] not in existing
+        ]
+        if updates:
+            conn.execute(
+                update(Hotel.__table__).where(Hotel.__table__.c.external_id == bindparam("b_external_id")),
+                updates
+            )
+        if inserts:
+            conn.execute(insert(Hotel.__table__), inserts)
+
+    return dict(conn.execute(
+        select(Hotel.external_id, Hotel.id).where(Hotel.external_id.in_([row["external_id"] for row in rows]))
+    ).all())
+
+
+def _write_batch(db: Session, records: List[Dict[str, Any]]):
+    # Last occurrence wins if the same id appears twice in one batch
+    rows_by_id = {}
+    amenities_by_id = {}
+    for record in records:
+        row = _hotel_row(record)
+        rows_by_id[row["external_id"]] = row
+        amenities_by_id[row["external_id"]] = sorted(set(record.get("amenities") or []))
+
+    ids = _upsert_hotels(db, list(rows_by_id.values()))
+
+    conn = db.connection()
+    amenities = HotelAmenity.__table__
+    conn.execute(delete(amenities).where(amenities.c.hotel_id.in_(list(ids.values()))))
+    amenity_rows = [
+        {"hotel_id": ids[external_id], "amenity": amenity}
+        for external_id, amenity_names in amenities_by_id.items()
+        for amenity in amenity_names
+    ]
+    if amenity_rows:
+        conn.execute(insert(amenities), amenity_rows)
+
+
+def load_catalog(path: str = DEFAULT_CATALOG_PATH, batch_size: int = CATALOG_BATCH_SIZE,
+                 db: Session = None) -> int:
+    """Upsert every hotel in the catalog, committing once per batch; returns the number loaded"""
+    own_session = db is None
+    db = db or SessionLocal()
+    loaded = 0
+    start = time.perf_counter()
+    try:
+        batch: List[Dict[str, Any]] = []
+        for record in iter_catalog(path):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                _write_batch(db, batch)
+                db.commit()
+                loaded += len(batch)
+                batch = []
+        if batch:
+            _write_batch(db, batch)
+            db.commit()
+            loaded += len(batch)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info(f"Loaded {loaded} hotels from {path} in {elapsed:.2f}s")
+    return loaded
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "load":
+        catalog_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CATALOG_PATH
+        started = time.perf_counter()
+        count = load_catalog(catalog_path)
+        print(f"✅ Upserted {count} hotels from {catalog_path} in {time.perf_counter() - started:.2f}s")
+    else:
+        print("Usage: python catalog.py load [path]")
@@ -1,25 +1,66 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, BigInteger, String, Float, DateTime, Text, LargeBinary, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import metrics
+import profiling
 
 DATABASE_URL = "sqlite:///./hotel_reviews.db"
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers (including online backups) run alongside writers
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.close()
+
+# One timing pair for the engine; the profiler observes the statements it times
+metrics.instrument_engine(engine, profiling.record_query)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 class Hotel(Base):
     __tablename__ = "hotels"
+    __table_args__ = (
+        # Listing indexes: sort column, then id as the keyset tie-breaker, then total_reviews so the
+        # min_reviews filter is answered from the index without touching table rows
+        Index("ix_hotels_sentiment_listing", "average_sentiment", "id", "total_reviews"),
+        Index("ix_hotels_reviews_listing", "total_reviews", "id"),
+        Index("ix_hotels_name_listing", "name", "id", "total_reviews"),
+        Index("ix_hotels_location_sentiment", "location", "average_sentiment", "id", "total_reviews"),
+        Index("ix_hotels_location_reviews", "location", "total_reviews", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String)
     location = Column(String)
     description = Column(Text)
     average_sentiment = Column(Float, default=0.0)
     total_reviews = Column(Integer, default=0)
+    external_id = Column(String, unique=True, index=True, nullable=True)  # Stable catalog id
+    category = Column(String, index=True, nullable=True)
+    price_range = Column(String, nullable=True)
+    phone = Column(String, nullable=True)
+    email = Column(String, nullable=True)
+    website = Column(String, nullable=True)
     
     reviews = relationship("Review", back_populates="hotel")
+    amenities = relationship("HotelAmenity", back_populates="hotel")
+
+class HotelAmenity(Base):
+    __tablename__ = "hotel_amenities"
+    __table_args__ = (
+        # Filtering by amenity reads hotel ids straight from the index
+        Index("ix_hotel_amenities_amenity_hotel", "amenity", "hotel_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    hotel_id = Column(Integer, ForeignKey("hotels.id"), index=True)
+    amenity = Column(String)
+    
+    hotel = relationship("Hotel", back_populates="amenities")
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -30,12 +71,86 @@ class Review(Base):
     review_text = Column(Text)
     sentiment_label = Column(String)  # "POSITIVE", "NEGATIVE", "NEUTRAL"
     sentiment_score = Column(Float)
+    sentiment_model = Column(String, index=True, nullable=True)  # Model version that produced the score
+    minhash = Column(LargeBinary, nullable=True)  # MinHash signature for near-duplicate detection
+    duplicate_of = Column(Integer, ForeignKey("reviews.id"), index=True, nullable=True)  # Original of a near-duplicate
+    sentiment_status = Column(String, default="DONE", index=True, nullable=True)  # "PENDING", "SCORING", "DONE"
+    scoring_claim = Column(String, nullable=True)  # Worker batch currently scoring a write-behind review
+    scoring_claimed_at = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     hotel = relationship("Hotel", back_populates="reviews")
 
+class ReviewBucket(Base):
+    __tablename__ = "review_lsh_buckets"
+    __table_args__ = (
+        # A lookup reads matching review ids straight from the index
+        Index("ix_review_lsh_buckets_band_bucket", "band", "bucket", "review_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    band = Column(Integer)
+    bucket = Column(BigInteger)  # Hash of the band's slice of the MinHash signature
+    review_id = Column(Integer, ForeignKey("reviews.id"))
+
+class SummaryJob(Base):
+    __tablename__ = "summary_jobs"
+    __table_args__ = (
+        # At most one active job per key, so concurrent identical submissions cannot both insert
+        Index(
+            "uq_summary_jobs_active_key", "job_key", unique=True,
+            sqlite_where=text("status IN ('PENDING', 'RUNNING')")
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_key = Column(String, index=True)  # Identical requests share a key for deduplication
+    kind = Column(String)  # "hotel" or "all_hotels"
+    hotel_id = Column(Integer, ForeignKey("hotels.id"), nullable=True)
+    max_length = Column(Integer, default=100)
+    min_length = Column(Integer, default=20)
+    status = Column(String, default="PENDING", index=True)  # "PENDING", "RUNNING", "DONE", "FAILED"
+    result = Column(Text, nullable=True)  # JSON-encoded summary result(s)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)  # Refreshed while RUNNING; a stale one means the worker died
+
+class RescoreJob(Base):
+    __tablename__ = "rescore_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    target_model = Column(String, index=True)  # Model version reviews are being re-scored with
+    status = Column(String, default="RUNNING")  # "RUNNING", "DONE"
+    last_review_id = Column(Integer, default=0)  # Keyset checkpoint: every review up to here is done
+    processed = Column(Integer, default=0)
+    elapsed_seconds = Column(Float, default=0.0)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+def add_missing_columns():
+    """Add columns and indexes defined on the models but missing from existing tables"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+            added = [column for column in table.columns if column.name not in existing_columns]
+            for column in added:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(bind=conn)
+
 # Create tables
 Base.metadata.create_all(bind=engine)
+add_missing_columns()
 
 # Dependency to get database session
 def get_db():
@@ -0,0 +1,277 @@
+"""
+Near-duplicate review detection
+MinHash signatures over character shingles, indexed by LSH band buckets, so a new review is
+compared only with the few stored reviews sharing a bucket instead of with every review.
+
+Usage:
+    python dedup.py run [chunk_size]    (signs and deduplicates reviews written before dedup existed)
+    python dedup.py status
+"""
+
+import hashlib
+import logging
+import os
+import re
+import time
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, insert, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Review, ReviewBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))  # Estimated Jaccard similarity
+DEDUP_CHUNK_SIZE = int(os.getenv("DEDUP_CHUNK_SIZE", "1000"))
+DEDUP_MAX_CANDIDATES = 50  # Bounds the work for reviews that land in a crowded bucket
+# Short generic reviews ("Great hotel!", "Loved it") are near-identical by nature, not copies
+DEDUP_MIN_SHINGLES = int(os.getenv("DEDUP_MIN_SHINGLES", "20"))
+
+# 16 bands x 8 rows: pairs around 0.85 similarity almost always share a bucket, pairs
+# below ~0.6 rarely do
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 5
+
+# Universal hashing a*x + b mod p; with x, a, b < 2^32 the products fit in uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(20240601)  # Fixed: stored signatures must stay comparable
+_A = _rng.randint(1, 2 ** 32 - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)[:, None]
+_B = _rng.randint(0, 2 ** 32 - 1, size=MINHASH_PERMUTATIONS, dtype=np.uint64)[:, None]
+
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+duplicates_detected = metrics.registry.counter(
+    "review_duplicates_total", "Near-duplicate reviews detected at write time", ("scope",)
+)
+
+
+class DuplicateMatch(NamedTuple):
+    review_id: int
+    hotel_id: int
+    similarity: float
+    sentiment_label: str
+    sentiment_score: Optional[float]  # None while a write-behind original is still being scored
+    sentiment_model: Optional[str]
+
+    @property
+    def scored(self) -> bool:
+        return self.sentiment_score is not None
+
+    def sentiment_result(self) -> Dict[str, Any]:
+        """The original's sentiment in the analyzer's result format"""
+        return {
+            "label": self.sentiment_label,
+            "score": self.sentiment_score,
+            "confidence": round(abs(self.sentiment_score - 0.5) * 2, 3),
+            "model_version": self.sentiment_model,
+        }
+
+
+def _normalize(text: str) -> str:
+    return _NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def long_enough(text: str) -> bool:
+    """Whether a review has enough shingles for a near-duplicate match to mean anything"""
+    return len(_normalize(text)) - SHINGLE_SIZE + 1 >= DEDUP_MIN_SHINGLES
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    normalized = _normalize(text)
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature of a text (MINHASH_PERMUTATIONS uint32 values)"""
+    hashes = _shingle_hashes(text)[None, :]
+    return ((_A * hashes + _B) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def to_bytes(sig: np.ndarray) -> bytes:
+    return sig.astype("<u4").tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype="<u4")
+
+
+def band_buckets(sig: np.ndarray) -> List[Tuple[int, int]]:
+    """(band, bucket) keys of a signature; buckets are signed 64-bit to fit an SQL INTEGER"""
+    raw = sig.astype("<u4").tobytes()
+    width = LSH_ROWS * 4
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(raw[band * width:(band + 1) * width], digest_size=8).digest(), "big", signed=True
+        ))
+        for band in range(LSH_BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+def find_duplicate(db: Session, sig: np.ndarray, hotel_id: Optional[int] = None) -> Optional[DuplicateMatch]:
+    """Most similar indexed review at or above DEDUP_THRESHOLD, preferring the same hotel"""
+    conn = db.connection()
+    # When a bucket is crowded, keep the same hotel's reviews, then those sharing the most bands
+    shared_bands = func.count(ReviewBucket.band)
+    candidate_ids = [row[0] for row in conn.execute(
+        select(ReviewBucket.review_id)
+        .join(Review, Review.id == ReviewBucket.review_id)
+        .where(tuple_(ReviewBucket.band, ReviewBucket.bucket).in_(band_buckets(sig)))
+        .group_by(ReviewBucket.review_id)
+        .order_by((func.max(Review.hotel_id) == hotel_id).desc(), shared_bands.desc(), ReviewBucket.review_id)
+        .limit(DEDUP_MAX_CANDIDATES)
+    )]
+    if not candidate_ids:
+        return None
+
+    best = None
+    best_key = None
+    for row in conn.execute(
+        select(Review.id, Review.hotel_id, Review.minhash, Review.sentiment_label,
+               Review.sentiment_score, Review.sentiment_model)
+        .where(Review.id.in_(candidate_ids), Review.minhash.isnot(None))
+    ):
+        score = similarity(sig, from_bytes(row.minhash))
+        if score < DEDUP_THRESHOLD:
+            continue
+        key = (row.hotel_id == hotel_id, score, -row.id)
+        if best_key is None or key > best_key:
+            best_key = key
+            best = DuplicateMatch(row.id, row.hotel_id, score, row.sentiment_label,
+                                  row.sentiment_score, row.sentiment_model)
+    return best
+
+
+def check_review(db: Session, hotel_id: int, text: str) -> Tuple[np.ndarray, Optional[DuplicateMatch]]:
+    """Signature of a new review and the review it near-duplicates, if any"""
+    sig = signature(text)
+    if not long_enough(text):
+        return sig, None
+    match = find_duplicate(db, sig, hotel_id)
+    if match is not None:
+        duplicates_detected.inc(scope="hotel" if match.hotel_id == hotel_id else "cross_hotel")
+    return sig, match
+
+
+def index_review(db: Session, review_id: int, sig: np.ndarray):
+    """Add a review's band buckets to the LSH index (inside the caller's transaction)"""
+    db.connection().execute(insert(ReviewBucket.__table__), [
+        {"band": band, "bucket": bucket, "review_id": review_id}
+        for band, bucket in band_buckets(sig)
+    ])
+
+
+def dedup_reviews(chunk_size: int = DEDUP_CHUNK_SIZE) -> Dict[str, Any]:
+    """
+    Sign, index and deduplicate reviews that have no signature yet
+
+    Reviews are walked in id order, so the earliest copy stays the original. Each chunk is
+    committed on its own and only unsigned reviews are selected, so an interrupted run simply
+    continues where it stopped.
+    """
+    import models
+
+    db = SessionLocal()
+    processed = 0
+    duplicates = 0
+    start = time.perf_counter()
+    try:
+        conn = db.connection()
+        review_table = Review.__table__
+        while True:
+            rows = conn.execute(
+                select(Review.id, Review.hotel_id, Review.review_text)
+                .where(Review.minhash.is_(None))
+                .order_by(Review.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            for row in rows:
+                sig = signature(row.review_text)
+                match = find_duplicate(db, sig, row.hotel_id) if long_enough(row.review_text) else None
+                values = {"minhash": to_bytes(sig)}
+                if match is not None and match.hotel_id == row.hotel_id:
+                    duplicates += 1
+                    values["duplicate_of"] = match.review_id
+                    if match.scored:
+                        values.update(
+                            sentiment_label=match.sentiment_label,
+                            sentiment_score=match.sentiment_score,
+                            sentiment_model=match.sentiment_model
+                        )
+                conn.execute(update(review_table).where(review_table.c.id == row.id).values(**values))
+                if "duplicate_of" not in values:
+                    index_review(db, row.id, sig)
+
+            processed += len(rows)
+            db.commit()
+            conn = db.connection()
+            logger.info(f"Deduplicated {processed} reviews ({duplicates} near-duplicates so far)")
+
+        if duplicates:
+            # Duplicates no longer count towards hotel aggregates
+            models.recompute_hotel_aggregates(db)
+
+        elapsed = time.perf_counter() - start
+        return {
+            "processed": processed,
+            "duplicates": duplicates,
+            "elapsed_seconds": round(elapsed, 2),
+            "reviews_per_second": round(processed / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+    finally:
+        db.close()
+
+
+def dedup_status() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return {
+            "reviews": db.query(Review.id).count(),
+            "unsigned": db.query(Review.id).filter(Review.minhash.is_(None)).count(),
+            "duplicates": db.query(Review.id).filter(Review.duplicate_of.isnot(None)).count(),
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "run":
+        size = int(sys.argv[2]) if len(sys.argv) > 2 else DEDUP_CHUNK_SIZE
+        report = dedup_reviews(chunk_size=size)
+        print(
+            f"✅ Signed {report['processed']} reviews, found {report['duplicates']} near-duplicates "
+            f"in {report['elapsed_seconds']}s ({report['reviews_per_second']} reviews/s)"
+        )
+    elif command == "status":
+        status = dedup_status()
+        print(f"Reviews: {status['reviews']}")
+        print(f"Without signature: {status['unsigned']}")
+        print(f"Near-duplicates: {status['duplicates']}")
+    else:
+        print("Available commands:")
+        print("  python dedup.py run [chunk_size]  - Sign and deduplicate existing reviews")
+        print("  python dedup.py status            - Show deduplication progress")
@@ -0,0 +1,437 @@
+"""
+Review embeddings
+A small sentence encoder turns reviews into unit vectors, appended in batches to a memory-mapped
+float32 matrix. Per-hotel centroid vectors are kept alongside it, so "similar hotels" compares one
+centroid with every other and review search is one matrix-vector product plus a partial sort.
+
+Files in EMBEDDING_DIR:
+    meta.json          model version, dimension, committed row count, last indexed review id
+    vectors.f32        (capacity, dim) unit review vectors; rows past `count` are not committed
+    rows.i64           (capacity, 2) review id and hotel id of each vector
+    centroid_sums.f32  (hotel capacity, dim) sum of a hotel's review vectors, indexed by hotel id
+    centroid_counts.i64
+
+Usage:
+    python embeddings.py build     (catches up with all reviews; rebuilds after a model change)
+    python embeddings.py status
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from database import SessionLocal, Review
+from metrics import registry, track_inference
+from model_server import use_model_server, RemoteModelProxy
+from model_registry import model_source, model_version
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+EMBEDDINGS_ENABLED = os.getenv("EMBEDDINGS_ENABLED", "true").lower() == "true"
+EMBEDDING_DIR = os.getenv("EMBEDDING_DIR", "./embeddings")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CHUNK_SIZE = int(os.getenv("EMBEDDING_CHUNK_SIZE", "1024"))  # Reviews read and appended per step
+EMBEDDING_POLL_SECONDS = float(os.getenv("EMBEDDING_POLL_SECONDS", "5"))
+EMBEDDING_MAX_TOKENS = 256
+# Rows scored per step of a review search, so the scores buffer stays cache-sized
+SEARCH_SCAN_ROWS = 1 << 16
+
+META_FILE = "meta.json"
+
+embedding_search_duration = registry.histogram(
+    "embedding_search_duration_seconds", "Vector search time, excluding query encoding", ("kind",)
+)
+embedded_reviews = registry.counter(
+    "embedded_reviews_total", "Reviews appended to the embedding index"
+)
+
+
+class ReviewEncoder:
+    def __init__(self):
+        """Load the sentence encoder (from the local model registry when it has been prepared)"""
+        self.model_version = model_version("embedding")
+        try:
+            from transformers import AutoModel, AutoTokenizer
+
+            source = model_source("embedding")
+            self.tokenizer = AutoTokenizer.from_pretrained(source, use_fast=True)
+            self.model = AutoModel.from_pretrained(source)
+            self.model.eval()
+            logger.info("Embedding model loaded successfully")
+        except Exception as e:
+            logger.error(f"Error loading embedding model: {e}")
+            self.model = None
+
+    def encode(self, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> List[List[float]]:
+        """Mean-pooled, L2-normalized embedding of each text (lists, so they cross the model server)"""
+        if self.model is None:
+            raise RuntimeError("Embedding model not loaded")
+        if not texts:
+            return []
+        import torch
+
+        vectors = []
+        with track_inference("embedding", batch_size=len(texts)), torch.inference_mode():
+            for start in range(0, len(texts), batch_size):
+                encoded = self.tokenizer(
+                    texts[start:start + batch_size], padding=True, truncation=True,
+                    max_length=EMBEDDING_MAX_TOKENS, return_tensors="pt"
+                )
+                hidden = self.model(**encoded).last_hidden_state
+                mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+                vectors.append(torch.nn.functional.normalize(pooled, dim=1))
+        return torch.cat(vectors).cpu().numpy().astype(np.float32).tolist()
+
+
+def _open_matrix(path: str, dtype, shape: Tuple[int, ...]) -> np.memmap:
+    """Memory-map a raw matrix file, growing it to `shape` first if needed (new space is zero)"""
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    mode = "r+b" if os.path.exists(path) else "w+b"
+    with open(path, mode) as f:
+        if os.fstat(f.fileno()).st_size < size:
+            f.truncate(size)
+    return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the whole array"""
+    if k <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.int64)
+    if k < scores.size:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+class EmbeddingIndex:
+    """
+    Append-only review embedding matrix with per-hotel centroids
+
+    meta.json is the commit point: data past its `count` is ignored, and a batch interrupted while
+    updating centroids (meta marked dirty) has its centroids rebuilt from the committed vectors by
+    the next writer. One process at a time holds the writer lock; readers in every process pick up
+    new rows when meta.json changes.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_DIR):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._meta: Optional[Dict[str, Any]] = None
+        self._meta_mtime: Optional[float] = None
+        self._vectors: Optional[np.memmap] = None
+        self._rows: Optional[np.memmap] = None
+        self._sums: Optional[np.memmap] = None
+        self._counts: Optional[np.memmap] = None
+        self._unit_centroids: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._writer_lock = None
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(META_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+        self._meta = meta
+        self._meta_mtime = os.stat(path).st_mtime_ns
+
+    def _open(self, capacity: int, hotel_capacity: int):
+        dim = self._meta["dim"]
+        self._vectors = _open_matrix(self._path("vectors.f32"), np.float32, (capacity, dim))
+        self._rows = _open_matrix(self._path("rows.i64"), np.int64, (capacity, 2))
+        self._sums = _open_matrix(self._path("centroid_sums.f32"), np.float32, (hotel_capacity, dim))
+        self._counts = _open_matrix(self._path("centroid_counts.i64"), np.int64, (hotel_capacity,))
+        self._unit_centroids = None
+
+    def _refresh(self) -> bool:
+        """Load or reload the index if meta.json changed; False when there is no index yet"""
+        path = self._path(META_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._meta = None
+            return False
+        if mtime != self._meta_mtime or self._vectors is None:
+            with open(path, "r") as f:
+                self._meta = json.load(f)
+            self._meta_mtime = mtime
+            self._open(self._meta["capacity"], self._meta["hotel_capacity"])
+        return True
+
+    def acquire_writer(self) -> bool:
+        """Become the single writer of the index; False while another process holds the lock"""
+        with self._lock:
+            if self._writer_lock is not None:
+                return True
+            os.makedirs(self.directory, exist_ok=True)
+            lock_file = open(self._path("writer.lock"), "w")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self._writer_lock = lock_file
+            return True
+
+    def _rebuild_centroids(self):
+        count = self._meta["count"]
+        self._sums[:] = 0
+        self._counts[:] = 0
+        hotel_ids = self._rows[:count, 1]
+        np.add.at(self._sums, hotel_ids, self._vectors[:count])
+        np.add.at(self._counts, hotel_ids, 1)
+        self._sums.flush()
+        self._counts.flush()
+        self._write_meta(dict(self._meta, dirty=False))
+        logger.warning(f"Rebuilt hotel centroids from {count} committed embeddings")
+
+    def reset(self, model: str, dim: int):
+        """Start an empty index for the given encoder"""
+        with self._lock:
+            for name in ("vectors.f32", "rows.i64", "centroid_sums.f32", "centroid_counts.i64"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            self._vectors = None
+            self._write_meta({
+                "model_version": model, "dim": dim, "count": 0, "last_review_id": 0,
+                "capacity": 1024, "hotel_capacity": 1024, "dirty": False,
+            })
+            self._open(1024, 1024)
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._refresh():
+                return None
+            return {key: self._meta[key] for key in ("model_version", "dim", "count", "last_review_id")}
+
+    def append(self, review_ids: List[int], hotel_ids: List[int], vectors: np.ndarray, last_review_id: int):
+        """Commit a batch of embeddings and fold them into their hotels' centroids"""
+        with self._lock:
+            self._refresh()
+            if self._meta.get("dirty"):
+                self._rebuild_centroids()
+            meta = dict(self._meta)
+            count = meta["count"]
+            needed = count + len(review_ids)
+            capacity, hotel_capacity = meta["capacity"], meta["hotel_capacity"]
+            while capacity < needed:
+                capacity *= 2
+            while hotel_ids and hotel_capacity <= max(hotel_ids):
+                hotel_capacity *= 2
+            if (capacity, hotel_capacity) != (meta["capacity"], meta["hotel_capacity"]):
+                meta.update(capacity=capacity, hotel_capacity=hotel_capacity)
+                self._open(capacity, hotel_capacity)
+
+            if review_ids:
+                self._vectors[count:needed] = vectors
+                self._rows[count:needed, 0] = review_ids
+                self._rows[count:needed, 1] = hotel_ids
+                self._vectors.flush()
+                self._rows.flush()
+
+                self._write_meta(dict(meta, dirty=True))
+                np.add.at(self._sums, hotel_ids, vectors)
+                np.add.at(self._counts, hotel_ids, 1)
+                self._sums.flush()
+                self._counts.flush()
+                self._unit_centroids = None
+
+            self._write_meta(dict(meta, count=needed, last_review_id=last_review_id, dirty=False))
+
+    def _centroids(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Hotel ids with embeddings and their unit centroids (one compact matrix, cached in memory)"""
+        if self._unit_centroids is None:
+            hotel_ids = np.flatnonzero(np.asarray(self._counts))
+            sums = np.asarray(self._sums[hotel_ids])
+            self._unit_centroids = (hotel_ids, sums / np.linalg.norm(sums, axis=1, keepdims=True))
+        return self._unit_centroids
+
+    def similar_hotels(self, hotel_id: int, limit: int = 10) -> List[Tuple[int, float]]:
+        """(hotel_id, cosine similarity) of the hotels whose review centroids are closest"""
+        with self._lock:
+            if not self._refresh() or hotel_id >= len(self._counts) or self._counts[hotel_id] == 0:
+                return []
+            start = time.perf_counter()
+            hotel_ids, centroids = self._centroids()
+            position = int(np.searchsorted(hotel_ids, hotel_id))
+            scores = centroids @ centroids[position]
+            scores[position] = -np.inf
+            best = _top_k(scores, min(limit, len(scores) - 1))
+            embedding_search_duration.observe(time.perf_counter() - start, kind="similar_hotels")
+            return [(int(hotel_ids[i]), float(scores[i])) for i in best]
+
+    def search(self, query: np.ndarray, limit: int = 10, hotel_id: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(review_id, cosine similarity) of the reviews closest to a query vector"""
+        with self._lock:
+            if not self._refresh():
+                return []
+            count = self._meta["count"]
+            vectors, rows = self._vectors, self._rows
+        start = time.perf_counter()
+        query = np.asarray(query, dtype=np.float32)
+        if hotel_id is not None:
+            # Gather one hotel's rows instead of scoring the whole matrix
+            positions = np.flatnonzero(rows[:count, 1] == hotel_id)
+            scores = vectors[positions] @ query
+            best_rows = positions[_top_k(scores, min(limit, len(scores)))]
+            best_scores = vectors[best_rows] @ query
+        else:
+            best_scores = np.empty(0, dtype=np.float32)
+            best_rows = np.empty(0, dtype=np.int64)
+            # Scan in blocks, keeping only each block's top candidates
+            for offset in range(0, count, SEARCH_SCAN_ROWS):
+                end = min(offset + SEARCH_SCAN_ROWS, count)
+                scores = vectors[offset:end] @ query
+                keep = _top_k(scores, min(limit, end - offset))
+                best_scores = np.concatenate([best_scores, scores[keep]])
+                best_rows = np.concatenate([best_rows, keep + offset])
+            order = _top_k(best_scores, min(limit, best_scores.size))
+            best_scores, best_rows = best_scores[order], best_rows[order]
+        embedding_search_duration.observe(time.perf_counter() - start, kind="reviews")
+        return [(int(rows[row, 0]), float(score)) for row, score in zip(best_rows, best_scores)]
+
+
+def build_index(index: "EmbeddingIndex", encoder, chunk_size: int = EMBEDDING_CHUNK_SIZE,
+                max_chunks: Optional[int] = None) -> int:
+    """
+    Embed reviews added since the last run and append them; returns the number embedded
+
+    Near-duplicates are skipped. A model change starts the index over. Does nothing while
+    another process holds the writer lock.
+    """
+    if not index.acquire_writer():
+        return 0
+    # From the registry, not the encoder: in remote mode only encode() may touch the proxy
+    version = model_version("embedding")
+    status = index.status()
+    if status is not None and status["model_version"] != version:
+        logger.info(f"Embedding model changed ({status['model_version']} -> {version}), rebuilding")
+        status = None
+    last_review_id = status["last_review_id"] if status else 0
+
+    db = SessionLocal()
+    embedded = 0
+    chunks = 0
+    try:
+        while max_chunks is None or chunks < max_chunks:
+            rows = db.execute(
+                select(Review.id, Review.hotel_id, Review.review_text, Review.duplicate_of)
+                .where(Review.id > last_review_id)
+                .order_by(Review.id)
+                .limit(chunk_size)
+            ).all()
+            db.rollback()  # Do not hold a read transaction while encoding
+            if not rows:
+                break
+            chunks += 1
+            originals = [row for row in rows if row.duplicate_of is None and row.review_text]
+            last_review_id = rows[-1].id
+            if not originals and status is None:
+                continue
+            vectors = np.asarray(encoder.encode([row.review_text for row in originals]), dtype=np.float32)
+            if status is None:
+                index.reset(version, vectors.shape[1])
+                status = index.status()
+            vectors = vectors.reshape(len(originals), status["dim"])
+            index.append([row.id for row in originals], [row.hotel_id for row in originals],
+                         vectors, last_review_id)
+            embedded += len(originals)
+            embedded_reviews.inc(len(originals))
+        return embedded
+    finally:
+        db.close()
+
+
+class EmbeddingIndexer:
+    """Background thread that keeps the embedding index up to date as reviews arrive"""
+
+    def __init__(self, index: "EmbeddingIndex", poll_seconds: float = EMBEDDING_POLL_SECONDS):
+        self.index = index
+        self.poll_seconds = poll_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._work, name="embedding-indexer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+
+    def notify(self):
+        """Index new reviews now instead of at the next poll"""
+        self._wake.set()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                # One chunk per step so stop() is never held up by a large backlog
+                if build_index(self.index, review_encoder, max_chunks=1):
+                    continue
+            except Exception as e:
+                logger.error(f"Embedding index update failed: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+
+def encode_query(text: str) -> np.ndarray:
+    return np.asarray(review_encoder.encode([text])[0], dtype=np.float32)
+
+
+# Global instances
+if not EMBEDDINGS_ENABLED:
+    review_encoder = None
+elif use_model_server():
+    review_encoder = RemoteModelProxy("embedding", ReviewEncoder, remote_methods=("encode",))
+else:
+    review_encoder = ReviewEncoder()
+
+embedding_index = EmbeddingIndex()
+embedding_indexer = EmbeddingIndexer(embedding_index)
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "build":
+        started = time.perf_counter()
+        count = build_index(embedding_index, review_encoder or ReviewEncoder())
+        print(f"✅ Embedded {count} reviews in {time.perf_counter() - started:.1f}s")
+    elif command == "status":
+        status = embedding_index.status()
+        if status is None:
+            print("No embedding index yet")
+        else:
+            print(f"Model: {status['model_version']} ({status['dim']} dimensions)")
+            print(f"Embedded reviews: {status['count']} (up to review {status['last_review_id']})")
+    else:
+        print("Available commands:")
+        print("  python embeddings.py build   - Embed reviews not yet in the index")
+        print("  python embeddings.py status  - Show the embedding index")
@@ -0,0 +1,210 @@
+"""
+Write-behind review ingestion
+In write_behind mode POST /reviews stores the review as PENDING and returns at once; a local
+worker thread claims pending reviews in batches, scores them in one batched call and updates
+the affected hotels' aggregates.
+
+Claims are leases recorded on the rows themselves (scoring_claim, scoring_claimed_at). A batch
+left in SCORING by a crashed or stopped process goes back to PENDING once its lease expires, so
+every accepted review is eventually scored, even with several API processes sharing the database.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import bindparam, select, update
+
+from database import SessionLocal, Review
+from sentiment import sentiment_analyzer
+import metrics
+import models
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+REVIEW_INGESTION_MODE = os.getenv("REVIEW_INGESTION_MODE", "sync").lower()  # "sync" or "write_behind"
+WRITE_BEHIND = REVIEW_INGESTION_MODE == "write_behind"
+REVIEW_SCORING_BATCH_SIZE = int(os.getenv("REVIEW_SCORING_BATCH_SIZE", "64"))
+REVIEW_SCORING_POLL_SECONDS = float(os.getenv("REVIEW_SCORING_POLL_SECONDS", "2"))
+# A claimed batch not finished within the lease is assumed lost and scored again
+REVIEW_SCORING_LEASE_SECONDS = int(os.getenv("REVIEW_SCORING_LEASE_SECONDS", "120"))
+
+PENDING = "PENDING"
+SCORING = "SCORING"
+DONE = "DONE"
+
+reviews_scored = metrics.registry.counter(
+    "write_behind_reviews_scored_total", "Write-behind reviews scored by the background worker"
+)
+reviews_recovered = metrics.registry.counter(
+    "write_behind_reviews_recovered_total", "Write-behind reviews returned to PENDING after an expired lease"
+)
+scoring_lag = metrics.registry.histogram(
+    "write_behind_scoring_lag_seconds", "Time from review submission until its sentiment is stored"
+)
+
+
+class ReviewScoringWorker:
+    """Background thread that scores PENDING reviews in batches"""
+
+    def __init__(self, batch_size: int = REVIEW_SCORING_BATCH_SIZE,
+                 poll_seconds: float = REVIEW_SCORING_POLL_SECONDS,
+                 lease_seconds: int = REVIEW_SCORING_LEASE_SECONDS):
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._work, name="review-scoring", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop after the current batch; an unfinished claim is recovered when its lease expires"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wake.set()
+        thread.join(timeout)
+
+    def notify(self):
+        """Wake the worker now instead of at the next poll"""
+        self._wake.set()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                scored = self.run_once()
+            except Exception as e:
+                # The batch is back in PENDING (or left to lease recovery); retry after the poll interval
+                logger.error(f"Review scoring batch failed: {e}")
+                scored = 0
+            if scored < self.batch_size:
+                # Drained or failing: sleep until the next submission or poll
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+
+    def recover_expired(self, db) -> int:
+        """Return reviews whose scoring lease has expired to PENDING"""
+        expired_before = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        result = db.execute(
+            update(Review.__table__)
+            .where(
+                Review.__table__.c.sentiment_status == SCORING,
+                Review.__table__.c.scoring_claimed_at < expired_before
+            )
+            .values(sentiment_status=PENDING, scoring_claim=None, scoring_claimed_at=None)
+        )
+        db.commit()
+        if result.rowcount:
+            reviews_recovered.inc(result.rowcount)
+            logger.warning(f"Recovered {result.rowcount} write-behind reviews from expired scoring leases")
+        return result.rowcount
+
+    def claim(self, db) -> str:
+        """Atomically mark the oldest pending reviews as SCORING under a new claim token"""
+        token = uuid.uuid4().hex
+        review_table = Review.__table__
+        oldest_pending = (
+            select(review_table.c.id)
+            .where(review_table.c.sentiment_status == PENDING)
+            .order_by(review_table.c.id)
+            .limit(self.batch_size)
+        )
+        db.execute(
+            update(review_table)
+            .where(review_table.c.sentiment_status == PENDING, review_table.c.id.in_(oldest_pending))
+            .values(sentiment_status=SCORING, scoring_claim=token, scoring_claimed_at=datetime.utcnow())
+        )
+        db.commit()
+        return token
+
+    def run_once(self) -> int:
+        """Recover expired leases, then claim, score and store one batch; returns reviews scored"""
+        db = SessionLocal()
+        try:
+            self.recover_expired(db)
+            token = self.claim(db)
+            rows = db.execute(
+                select(Review.id, Review.hotel_id, Review.review_text, Review.created_at)
+                .where(Review.scoring_claim == token)
+                .order_by(Review.id)
+            ).all()
+            if not rows:
+                return 0
+
+            results = sentiment_analyzer.analyze_sentiment_batch(
+                [row.review_text or "" for row in rows], batch_size=self.batch_size
+            )
+            failed = next((result for result in results if "error" in result), None)
+            if failed is not None:
+                self._release(db, token)
+                raise RuntimeError(f"Sentiment analysis failed: {failed['error']}")
+
+            # Only rows still under this claim: a batch that outlived its lease may have been re-claimed
+            review_table = Review.__table__
+            db.connection().execute(
+                update(review_table)
+                .where(review_table.c.id == bindparam("b_id"), review_table.c.scoring_claim == token)
+                .values(
+                    sentiment_label=bindparam("b_label"),
+                    sentiment_score=bindparam("b_score"),
+                    sentiment_model=bindparam("b_model"),
+                    sentiment_status=DONE,
+                    scoring_claim=None,
+                    scoring_claimed_at=None
+                ),
+                [
+                    {
+                        "b_id": row.id,
+                        "b_label": result["label"],
+                        "b_score": result["score"],
+                        "b_model": result.get("model_version"),
+                    }
+                    for row, result in zip(rows, results)
+                ]
+            )
+            # Aggregates from the table, in the same transaction, so they never count a review twice
+            models.recompute_hotel_aggregates(db, {row.hotel_id for row in rows})
+
+            now = datetime.utcnow()
+            for row in rows:
+                scoring_lag.observe((now - row.created_at).total_seconds())
+            reviews_scored.inc(len(rows))
+            return len(rows)
+        finally:
+            db.close()
+
+    def _release(self, db, token: str):
+        db.rollback()
+        db.execute(
+            update(Review.__table__)
+            .where(Review.__table__.c.scoring_claim == token)
+            .values(sentiment_status=PENDING, scoring_claim=None, scoring_claimed_at=None)
+        )
+        db.commit()
+
+    def backlog(self) -> int:
+        """Reviews accepted but not scored yet"""
+        db = SessionLocal()
+        try:
+            return db.query(Review.id).filter(Review.sentiment_status.in_((PENDING, SCORING))).count()
+        finally:
+            db.close()
+
+
+# Global instance
+review_scoring = ReviewScoringWorker()
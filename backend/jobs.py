@@ -0,0 +1,263 @@
+"""
+Background summarization jobs
+Jobs are persisted in the summary_jobs table and executed by a bounded pool of local worker
+threads. A worker claims a job atomically (PENDING -> RUNNING) and a sweeper thread refreshes the
+heartbeat of the jobs this process is running. The sweeper also returns RUNNING jobs whose
+heartbeat stopped (their process died) to PENDING and queues pending jobs that did not fit in the
+local queue, so nothing is stranded and live jobs in other processes are left alone.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Hotel, SummaryJob
+from summarization import review_summarizer
+import metrics
+import models
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+SUMMARY_JOB_WORKERS = int(os.getenv("SUMMARY_JOB_WORKERS", "2"))
+SUMMARY_JOB_QUEUE_SIZE = int(os.getenv("SUMMARY_JOB_QUEUE_SIZE", "1000"))
+SUMMARY_JOB_HEARTBEAT_SECONDS = float(os.getenv("SUMMARY_JOB_HEARTBEAT_SECONDS", "15"))
+# A RUNNING job without a heartbeat for this long is assumed lost and run again
+SUMMARY_JOB_LEASE_SECONDS = int(os.getenv("SUMMARY_JOB_LEASE_SECONDS", "60"))
+
+summary_jobs_total = metrics.registry.counter(
+    "summary_jobs_total", "Summarization jobs by outcome", ("kind", "status")
+)
+summary_jobs_queued = metrics.registry.gauge(
+    "summary_jobs_queued", "Summarization jobs waiting for a worker"
+)
+
+
+def job_key(kind: str, hotel_id: Optional[int], max_length: int, min_length: int) -> str:
+    """Key shared by identical requests so duplicates attach to the same job"""
+    return f"{kind}:{hotel_id or '*'}:{max_length}:{min_length}"
+
+
+def summarize_hotel(db: Session, hotel: Hotel, max_length: int, min_length: int) -> Dict[str, Any]:
+    """Summarize one hotel's reviews (no latency budget: this runs off the request path)"""
+    reviews = models.get_hotel_reviews(db, hotel_id=hotel.id, include_duplicates=False)
+    review_texts = [review.review_text for review in reviews if review.review_text]
+    result = review_summarizer.summarize_reviews(review_texts, max_length=max_length, min_length=min_length)
+    result["hotel_id"] = hotel.id
+    result["hotel_name"] = hotel.name
+    return result
+
+
+class SummaryJobRunner:
+    """Bounded local worker pool for persisted summarization jobs"""
+
+    def __init__(self, workers: int = SUMMARY_JOB_WORKERS, queue_size: int = SUMMARY_JOB_QUEUE_SIZE,
+                 heartbeat_seconds: float = SUMMARY_JOB_HEARTBEAT_SECONDS,
+                 lease_seconds: int = SUMMARY_JOB_LEASE_SECONDS):
+        self.workers = workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self.lease_seconds = lease_seconds
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._queued: Set[int] = set()
+        self._running: Set[int] = set()
+        self._stopping = threading.Event()
+
+    def start(self):
+        """Start the workers and the sweeper, then queue jobs left unfinished by a previous run"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"summary-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            sweeper = threading.Thread(target=self._sweep, name="summary-job-sweeper", daemon=True)
+            sweeper.start()
+        self.recover()
+
+    def stop(self):
+        """Stop the workers after their current job; queued jobs stay PENDING for the next start"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+            self._stopping.set()
+            # Drain first so the wake-up sentinels fit; never block shutdown on a full queue
+            while True:
+                try:
+                    job_id = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job_id is not None:
+                    self._queued.discard(job_id)
+                    summary_jobs_queued.dec()
+        for _ in threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break  # Workers also notice _stopping on their next poll
+
+    def recover(self):
+        """Return jobs with an expired heartbeat to PENDING and queue pending jobs that fit"""
+        db = SessionLocal()
+        try:
+            expired_before = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+            recovered = models.recover_stale_summary_jobs(db, expired_before)
+            if recovered:
+                # Their process died mid-job; run them again from the start
+                logger.warning(f"Recovered {recovered} summarization jobs with an expired heartbeat")
+
+            free = self._queue.maxsize - self._queue.qsize()
+            if free <= 0:
+                return
+            with self._lock:
+                local = self._queued | self._running
+            for job_id in models.get_pending_summary_job_ids(db, limit=free + len(local)):
+                if job_id not in local:
+                    self.enqueue(job_id)
+        finally:
+            db.close()
+
+    def _sweep(self):
+        while not self._stopping.wait(self.heartbeat_seconds):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                db = SessionLocal()
+                try:
+                    models.heartbeat_summary_jobs(db, running)
+                finally:
+                    db.close()
+                self.recover()
+            except Exception as e:
+                logger.error(f"Summary job sweep failed: {e}")
+
+    def submit(
+        self,
+        db: Session,
+        kind: str,
+        hotel_id: Optional[int] = None,
+        max_length: int = 100,
+        min_length: int = 20
+    ) -> SummaryJob:
+        """Create a job, or return the identical one already pending or running"""
+        key = job_key(kind, hotel_id, max_length, min_length)
+        existing = models.get_active_summary_job(db, key)
+        if existing is not None:
+            return existing
+
+        try:
+            job = models.create_summary_job(
+                db, job_key=key, kind=kind, hotel_id=hotel_id, max_length=max_length, min_length=min_length
+            )
+        except IntegrityError:
+            # An identical request (possibly in another process) created the active job first
+            db.rollback()
+            existing = models.get_active_summary_job(db, key)
+            if existing is None:
+                raise
+            return existing
+        self.enqueue(job.id)
+        return job
+
+    def enqueue(self, job_id: int):
+        with self._lock:
+            if job_id in self._queued or job_id in self._running:
+                return
+            try:
+                self._queue.put_nowait(job_id)
+            except queue.Full:
+                # Still persisted as PENDING; the sweeper queues it once there is room
+                logger.warning(f"Summary job queue full, job {job_id} deferred")
+                return
+            self._queued.add(job_id)
+        summary_jobs_queued.inc()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                job_id = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if job_id is None:
+                return
+            summary_jobs_queued.dec()
+            with self._lock:
+                self._queued.discard(job_id)
+                self._running.add(job_id)
+            try:
+                self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"Summary job {job_id} crashed: {e}")
+            finally:
+                with self._lock:
+                    self._running.discard(job_id)
+
+    def run_job(self, job_id: int):
+        db = SessionLocal()
+        try:
+            # Another worker or process may have queued the same job; only one claim succeeds
+            if not models.claim_summary_job(db, job_id):
+                return
+            job = models.get_summary_job(db, job_id)
+
+            try:
+                if job.kind == "all_hotels":
+                    result = self._summarize_all(db, job.max_length, job.min_length)
+                else:
+                    hotel = models.get_hotel(db, hotel_id=job.hotel_id)
+                    if hotel is None:
+                        raise ValueError("Hotel not found")
+                    result = summarize_hotel(db, hotel, job.max_length, job.min_length)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Summary job {job_id} failed: {e}")
+                models.update_summary_job(db, job, "FAILED", error=str(e))
+                summary_jobs_total.inc(kind=job.kind, status="FAILED")
+                return
+
+            models.update_summary_job(db, job, "DONE", result=json.dumps(result))
+            summary_jobs_total.inc(kind=job.kind, status="DONE")
+        finally:
+            db.close()
+
+    def _summarize_all(self, db: Session, max_length: int, min_length: int) -> Dict[str, Any]:
+        """
+        Summarize every hotel with reviews
+
+        Hotels and their review texts are read one keyset page at a time, but the result holds
+        one summary per hotel and is stored as a single JSON document, so its size (and the
+        memory needed to build and serve it) grows with the number of hotels.
+        """
+        summaries = []
+        last_id = 0
+        while True:
+            # Walk the catalog by primary key so only one page of review texts is in memory
+            hotels = db.query(Hotel.id, Hotel.name).filter(
+                Hotel.id > last_id, Hotel.total_reviews > 0
+            ).order_by(Hotel.id).limit(100).all()
+            if not hotels:
+                break
+            # One text-only query and batched generation per page of hotels
+            texts = models.get_review_texts_by_hotel(db, [hotel.id for hotel in hotels])
+            results = review_summarizer.summarize_reviews_batch(
+                [texts[hotel.id] for hotel in hotels], max_length=max_length, min_length=min_length
+            )
+            for hotel, result in zip(hotels, results):
+                result["hotel_id"] = hotel.id
+                result["hotel_name"] = hotel.name
+                summaries.append(result)
+            last_id = hotels[-1].id
+        return {"hotels": summaries, "total_hotels": len(summaries)}
+
+
+# Global instance
+summary_jobs = SummaryJobRunner()
@@ -0,0 +1,258 @@
+"""
+Lexicon sentiment scorer
+A cheap linear scorer over a hotel-review word list. It is the first stage of the sentiment
+cascade: texts it scores above the calibrated confidence threshold never reach the transformer.
+
+Usage:
+    python lexicon.py export-reference <reference.jsonl> [limit]
+    python lexicon.py calibrate <reference.jsonl> [target_agreement]
+    python lexicon.py evaluate <reference.jsonl> [threshold]
+
+A reference set is JSON Lines with "text" and "label" (POSITIVE or NEGATIVE) per line.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from model_registry import MODEL_REGISTRY_DIR
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the word list or weights change: calibrations and stored scores are tied to it
+LEXICON_VERSION = "lexicon-v1"
+
+LEXICON_CALIBRATION_FILE = os.getenv(
+    "LEXICON_CALIBRATION_FILE", os.path.join(MODEL_REGISTRY_DIR, "lexicon_calibration.json")
+)
+DEFAULT_THRESHOLD = 0.95
+# Longer texts mix opinions too often for a bag of words; they always go to the transformer
+LEXICON_MAX_WORDS = int(os.getenv("LEXICON_MAX_WORDS", "64"))
+
+_WEIGHTS: Dict[str, float] = {
+    # Positive
+    "amazing": 3.0, "awesome": 2.5, "beautiful": 2.0, "best": 2.5, "clean": 1.5, "comfortable": 2.0,
+    "cozy": 1.5, "delicious": 2.0, "excellent": 3.0, "exceptional": 3.0, "fantastic": 3.0,
+    "friendly": 2.0, "good": 1.5, "gorgeous": 2.5, "great": 2.5, "happy": 1.5, "helpful": 2.0,
+    "impeccable": 3.0, "love": 2.5, "loved": 2.5, "lovely": 2.0, "nice": 1.5, "outstanding": 3.0,
+    "perfect": 3.0, "pleasant": 1.5, "quiet": 1.0, "recommend": 2.0, "recommended": 2.0,
+    "relaxing": 1.5, "spacious": 1.5, "spotless": 2.5, "stunning": 2.5, "superb": 3.0,
+    "wonderful": 3.0,
+    # Negative
+    "avoid": -3.0, "awful": -3.0, "bad": -2.0, "broken": -2.0, "cold": -1.0, "dirty": -2.5,
+    "disappointed": -2.5, "disappointing": -2.5, "disgusting": -3.0, "filthy": -3.0, "horrible": -3.0,
+    "mediocre": -1.5, "mold": -2.5, "noisy": -2.0, "overpriced": -2.0, "poor": -2.0, "rude": -2.5,
+    "slow": -1.0, "smelly": -2.5, "terrible": -3.0, "unfriendly": -2.5, "unhelpful": -2.0,
+    "uncomfortable": -2.0, "worst": -3.0, "worse": -2.0,
+}
+_NEGATORS = {"not", "no", "never", "hardly", "nothing", "nobody", "without"}
+_INTENSIFIERS = {"very": 1.5, "really": 1.4, "extremely": 1.7, "absolutely": 1.6, "so": 1.3,
+                 "super": 1.5, "truly": 1.4, "incredibly": 1.7}
+_NEGATION_SCOPE = 3
+_BIAS = 0.0
+
+_TOKENS = re.compile(r"[a-z]+(?:'[a-z]+)?|[.!?;]")
+
+
+class LexiconEstimate(NamedTuple):
+    label: str
+    probability: float  # Probability of POSITIVE
+    confidence: float   # Probability of the predicted label; 0 when the text is out of scope
+
+    def to_result(self) -> Dict[str, Any]:
+        """Same result format as the transformer analyzer"""
+        if self.label == "POSITIVE":
+            score = 0.5 + self.confidence * 0.5
+        elif self.label == "NEGATIVE":
+            score = 0.5 - self.confidence * 0.5
+        else:
+            score = 0.5
+        return {
+            "label": self.label,
+            "score": round(score, 3),
+            "confidence": round(self.confidence, 3),
+            "model_version": LEXICON_VERSION,
+        }
+
+
+def score(text: str) -> LexiconEstimate:
+    """Score one text with the lexicon"""
+    tokens = _TOKENS.findall((text or "").lower())
+    words = sum(1 for token in tokens if token[0].isalpha())
+    if words == 0 or words > LEXICON_MAX_WORDS:
+        return LexiconEstimate("NEUTRAL", 0.5, 0.0)
+
+    logit = _BIAS
+    hits = 0
+    negated = 0      # Tokens left in the current negation scope
+    boost = 1.0
+    for token in tokens:
+        if not token[0].isalpha():
+            # Punctuation closes negation scope
+            negated, boost = 0, 1.0
+            continue
+        if token == "but":
+            # "clean but noisy": the clause after "but" carries the verdict
+            logit *= 0.5
+            negated, boost = 0, 1.0
+            continue
+        if token in _NEGATORS or token.endswith("n't"):
+            negated = _NEGATION_SCOPE
+            continue
+        if token in _INTENSIFIERS:
+            boost = _INTENSIFIERS[token]
+            continue
+        weight = _WEIGHTS.get(token)
+        if weight is not None:
+            hits += 1
+            logit += -weight * boost if negated else weight * boost
+            boost = 1.0
+        if negated:
+            negated -= 1
+
+    if hits == 0:
+        return LexiconEstimate("NEUTRAL", 0.5, 0.0)
+
+    probability = 1.0 / (1.0 + math.exp(-logit))
+    if probability == 0.5:
+        return LexiconEstimate("NEUTRAL", 0.5, 0.0)
+    label = "POSITIVE" if probability > 0.5 else "NEGATIVE"
+    return LexiconEstimate(label, probability, max(probability, 1.0 - probability))
+
+
+def score_batch(texts: Iterable[str]) -> List[LexiconEstimate]:
+    return [score(text) for text in texts]
+
+
+def cascade_threshold() -> float:
+    """Confidence needed to skip the transformer: env override, then calibration, then default"""
+    override = os.getenv("SENTIMENT_CASCADE_THRESHOLD")
+    if override:
+        return float(override)
+    if os.path.exists(LEXICON_CALIBRATION_FILE):
+        with open(LEXICON_CALIBRATION_FILE, "r") as f:
+            calibration = json.load(f)
+        if calibration.get("lexicon_version") == LEXICON_VERSION:
+            return float(calibration["threshold"])
+        logger.warning(
+            f"Ignoring lexicon calibration for {calibration.get('lexicon_version')}; "
+            f"recalibrate for {LEXICON_VERSION}"
+        )
+    return DEFAULT_THRESHOLD
+
+
+def load_reference(path: str) -> List[Tuple[str, str]]:
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    return [(row["text"], row["label"].upper()) for row in rows]
+
+
+def evaluate(reference: List[Tuple[str, str]], threshold: float) -> Dict[str, Any]:
+    """Coverage (share of texts short-circuited) and agreement with the reference labels"""
+    estimates = score_batch(text for text, _ in reference)
+    taken = [
+        (estimate.label, label)
+        for estimate, (_, label) in zip(estimates, reference)
+        if estimate.confidence >= threshold
+    ]
+    agreed = sum(1 for predicted, label in taken if predicted == label)
+    return {
+        "threshold": threshold,
+        "reference_size": len(reference),
+        "coverage": round(len(taken) / len(reference), 4) if reference else 0.0,
+        "agreement": round(agreed / len(taken), 4) if taken else 1.0,
+    }
+
+
+def calibrate(reference: List[Tuple[str, str]], target_agreement: float = 0.97) -> Dict[str, Any]:
+    """
+    Pick the lowest threshold whose short-circuited texts still agree with the reference labels
+    at least `target_agreement` of the time, i.e. the largest safe coverage
+    """
+    scored = sorted(
+        ((estimate.confidence, estimate.label == label)
+         for estimate, (_, label) in zip(score_batch(text for text, _ in reference), reference)
+         if estimate.confidence > 0),
+        reverse=True
+    )
+    # Start above any reachable confidence: with no safe cut, nothing is short-circuited
+    threshold, agreed, taken = 1.01, 0, 0
+    for i, (confidence, correct) in enumerate(scored):
+        taken += 1
+        agreed += correct
+        # Only cut between distinct confidences so every text at the threshold is counted
+        boundary = i + 1 == len(scored) or scored[i + 1][0] < confidence
+        if boundary and agreed / taken >= target_agreement:
+            threshold = confidence
+
+    result = evaluate(reference, threshold)
+    result.update({
+        "target_agreement": target_agreement,
+        "lexicon_version": LEXICON_VERSION,
+        "created_at": datetime.utcnow().isoformat(),
+    })
+    return result
+
+
+def save_calibration(calibration: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(LEXICON_CALIBRATION_FILE)), exist_ok=True)
+    with open(LEXICON_CALIBRATION_FILE + ".tmp", "w") as f:
+        json.dump(calibration, f, indent=2)
+    os.replace(LEXICON_CALIBRATION_FILE + ".tmp", LEXICON_CALIBRATION_FILE)
+
+
+def export_reference(path: str, limit: Optional[int] = None) -> int:
+    """Write stored reviews labeled by the transformer as a reference set"""
+    from database import SessionLocal, Review
+
+    db = SessionLocal()
+    exported = 0
+    try:
+        query = db.query(Review.review_text, Review.sentiment_label).filter(
+            Review.sentiment_label.in_(("POSITIVE", "NEGATIVE")),
+            Review.sentiment_model.isnot(None),
+            Review.sentiment_model != LEXICON_VERSION
+        ).order_by(Review.id)
+        if limit:
+            query = query.limit(limit)
+        with open(path, "w", encoding="utf-8") as out:
+            for text, label in query.yield_per(1000):
+                out.write(json.dumps({"text": text, "label": label}) + "\n")
+                exported += 1
+    finally:
+        db.close()
+    return exported
+
+
+if __name__ == "__main__":
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "export-reference" and len(sys.argv) > 2:
+        count = export_reference(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else None)
+        print(f"✅ Exported {count} transformer-labeled reviews to {sys.argv[2]}")
+    elif command == "calibrate" and len(sys.argv) > 2:
+        target = float(sys.argv[3]) if len(sys.argv) > 3 else 0.97
+        calibration = calibrate(load_reference(sys.argv[2]), target)
+        save_calibration(calibration)
+        print(
+            f"✅ Threshold {calibration['threshold']:.4f}: {calibration['coverage']:.1%} of texts skip the "
+            f"transformer at {calibration['agreement']:.1%} agreement (saved to {LEXICON_CALIBRATION_FILE})"
+        )
+    elif command == "evaluate" and len(sys.argv) > 2:
+        threshold = float(sys.argv[3]) if len(sys.argv) > 3 else cascade_threshold()
+        report = evaluate(load_reference(sys.argv[2]), threshold)
+        print(
+            f"Threshold {report['threshold']:.4f}: coverage {report['coverage']:.1%}, "
+            f"agreement {report['agreement']:.1%} over {report['reference_size']} texts"
+        )
+    else:
+        print("Available commands:")
+        print("  python lexicon.py export-reference <file> [limit]   - Export transformer-labeled reviews")
+        print("  python lexicon.py calibrate <file> [target]         - Tune the cascade threshold (default 0.97)")
+        print("  python lexicon.py evaluate <file> [threshold]       - Coverage and agreement at a threshold")
@@ -1,15 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException
+# Imported first so MODEL_OFFLINE sets the hub offline flags before anything imports transformers
+import model_registry
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import threading
+import time
 from database import get_db, Hotel, Review
 from sentiment import sentiment_analyzer
-from summarization import review_summarizer
+from summarization import review_summarizer, ReviewSummarizer
+from jobs import summary_jobs
+from ingestion import review_scoring, WRITE_BEHIND
+from embeddings import embedding_index, embedding_indexer, encode_query, review_encoder
 import models
+import metrics
+import dedup
+import profiling
+import backup
+from compression import CompressionMiddleware
+from model_server import ModelServerTimeout, ModelServerUnavailable
+
+# Most hotels a single /summarize/compare request may cover
+COMPARE_MAX_HOTELS = 20
+# How often a streamed summary checks whether its client is still connected
+STREAM_DISCONNECT_POLL_SECONDS = 0.25
 
 # Initialize FastAPI app
 app = FastAPI(title="Hotel Review Sentiment Analysis API", version="1.0.0")
+app.router.route_class = profiling.ProfiledRoute
 
 # Configure CORS - simplified for development
 app.add_middleware(
@@ -18,7 +41,55 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(CompressionMiddleware)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record latency, error and SQL statistics for every request"""
+    token = metrics.start_request_tracking()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Use the route template so /hotels/1 and /hotels/2 share a series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.http_request_duration.observe(
+            time.perf_counter() - start, method=request.method, route=route, status=str(status)
+        )
+        if status >= 500:
+            metrics.http_errors.inc(method=request.method, route=route)
+        metrics.finish_request_tracking(token, route)
+
+@app.exception_handler(ModelServerUnavailable)
+async def model_server_unavailable(request: Request, exc: ModelServerUnavailable):
+    """The shared model server is down and in-process fallback is disabled"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+@app.exception_handler(ModelServerTimeout)
+async def model_server_timeout(request: Request, exc: ModelServerTimeout):
+    """The shared model server is up but did not answer in time"""
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Profile the request when asked for via header or picked by sampling"""
+    if not profiling.should_profile(request.headers):
+        return await call_next(request)
+    
+    profile, token = profiling.start_profile(request.method, request.url.path)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        profiling.finish_profile(profile, token, time.perf_counter() - start)
+    response.headers["X-Profile-Id"] = profile.id
+    response.headers["Server-Timing"] = profile.server_timing()
+    return response
 
 # Pydantic models for request/response
 class SentimentAnalysisRequest(BaseModel):
@@ -40,9 +111,30 @@ class ReviewResponse(BaseModel):
     hotel_id: int
     reviewer_name: str
     review_text: str
-    sentiment_label: str
-    sentiment_score: float
+    sentiment_label: str  # "PENDING" until a write-behind review is scored
+    sentiment_score: Optional[float] = None
     created_at: str
+    duplicate_of: Optional[int] = None  # Set for near-duplicates of an earlier review of this hotel
+    sentiment_status: str = "DONE"  # "PENDING", "SCORING" or "DONE"
+
+# Fields whose response value is not the column value as is
+_REVIEW_VALUES = {
+    "created_at": lambda review: review.created_at.isoformat(),
+    "sentiment_status": lambda review: review.sentiment_status or "DONE",
+}
+
+def review_response(
+    review: Review,
+    response_class=ReviewResponse,
+    fields: Optional[List[str]] = None,
+    **extra
+) -> ReviewResponse:
+    """Build a review response from `fields` only (default: all), so unloaded columns are never read"""
+    values = {
+        name: _REVIEW_VALUES[name](review) if name in _REVIEW_VALUES else getattr(review, name)
+        for name in fields or models.REVIEW_FIELDS
+    }
+    return response_class(**values, **extra)
 
 class HotelResponse(BaseModel):
     id: int
@@ -51,21 +143,52 @@ class HotelResponse(BaseModel):
     description: str
     average_sentiment: float
     total_reviews: int
+    category: Optional[str] = None
+    price_range: Optional[str] = None
     
-class HotelDetailResponse(BaseModel):
+class SimilarHotelResponse(HotelResponse):
+    similarity: float  # Cosine similarity of the hotels' review-embedding centroids
+
+class ReviewSearchResult(ReviewResponse):
+    similarity: float  # Cosine similarity to the query
+
+# Sparse fieldsets (`fields=`) on the hotel endpoints: every field but the id may be left out,
+# and those endpoints only serialize the fields that were set
+
+class SparseReviewResponse(BaseModel):
     id: int
-    name: str
-    location: str
-    description: str
-    average_sentiment: float
-    total_reviews: int
-    reviews: List[ReviewResponse]
+    hotel_id: Optional[int] = None
+    reviewer_name: Optional[str] = None
+    review_text: Optional[str] = None
+    sentiment_label: Optional[str] = None
+    sentiment_score: Optional[float] = None
+    created_at: Optional[str] = None
+    duplicate_of: Optional[int] = None
+    sentiment_status: Optional[str] = None
+
+class SparseHotelResponse(BaseModel):
+    id: int
+    name: Optional[str] = None
+    location: Optional[str] = None
+    description: Optional[str] = None
+    average_sentiment: Optional[float] = None
+    total_reviews: Optional[int] = None
+    category: Optional[str] = None
+    price_range: Optional[str] = None
+
+class HotelDetailResponse(SparseHotelResponse):
+    amenities: Optional[List[str]] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    website: Optional[str] = None
+    reviews: Optional[List[SparseReviewResponse]] = None  # Only with include=reviews (or no fields/include)
 
 class SummarizationRequest(BaseModel):
     hotel_id: Optional[int] = None
     hotel_name: Optional[str] = None
     max_length: Optional[int] = 100
     min_length: Optional[int] = 20
+    deadline_ms: Optional[int] = None  # Latency budget; server default when omitted
 
 class SummarizationResponse(BaseModel):
     hotel_id: int
@@ -75,6 +198,69 @@ class SummarizationResponse(BaseModel):
     processed_reviews: int
     model_used: Optional[str] = None
     error: Optional[str] = None
+    deadline_exceeded: Optional[bool] = None
+    # When not served: "background" or "cancelled" (deadline passed), "skipped" (model busy,
+    # not attempted) or "failed"
+    abstractive_status: Optional[str] = None
+    served_from_cache: Optional[bool] = None
+    timings_ms: Optional[Dict[str, float]] = None
+
+class CompareSummariesRequest(BaseModel):
+    hotel_ids: Optional[List[int]] = None
+    location: Optional[str] = None  # Compare the most-reviewed hotels at this location
+    max_length: Optional[int] = 100
+    min_length: Optional[int] = 20
+
+class HotelComparison(BaseModel):
+    hotel_id: int
+    hotel_name: str
+    location: str
+    summary: str
+    average_sentiment: float
+    total_reviews: int
+    processed_reviews: int
+    positive_reviews: int
+    negative_reviews: int
+    neutral_reviews: int
+    model_used: Optional[str] = None
+    served_from_cache: Optional[bool] = None
+    error: Optional[str] = None
+
+class CompareSummariesResponse(BaseModel):
+    hotels: List[HotelComparison]
+    total_hotels: int
+    timings_ms: Dict[str, float]
+
+class SummaryJobRequest(BaseModel):
+    hotel_id: Optional[int] = None
+    hotel_name: Optional[str] = None
+    all_hotels: bool = False  # Summarize every hotel with reviews (nightly runs)
+    max_length: Optional[int] = 100
+    min_length: Optional[int] = 20
+
+class SummaryJobResponse(BaseModel):
+    job_id: int
+    kind: str
+    hotel_id: Optional[int] = None
+    status: str
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+def _summary_job_response(job) -> SummaryJobResponse:
+    return SummaryJobResponse(
+        job_id=job.id,
+        kind=job.kind,
+        hotel_id=job.hotel_id,
+        status=job.status,
+        created_at=job.created_at.isoformat(),
+        started_at=job.started_at.isoformat() if job.started_at else None,
+        finished_at=job.finished_at.isoformat() if job.finished_at else None,
+        result=json.loads(job.result) if job.result else None,
+        error=job.error
+    )
 
 @app.on_event("startup")
 async def startup_event():
@@ -82,12 +268,49 @@ async def startup_event():
     db = next(get_db())
     models.seed_sample_hotels(db)
     db.close()
+    # Restore refuses to overwrite the database while this process is using it
+    backup.hold_database()
+    summary_jobs.start()
+    if WRITE_BEHIND:
+        review_scoring.start()
+    if review_encoder is not None:
+        embedding_indexer.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    summary_jobs.stop()
+    review_scoring.stop()
+    embedding_indexer.stop()
 
 @app.get("/")
 async def root():
     """Root endpoint"""
     return {"message": "Hotel Review Sentiment Analysis API"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Expose application metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+def require_profile_token(request: Request):
+    """Profiles expose query text and timings; hide them unless the profiling token is sent"""
+    if not profiling.authorized(request.headers):
+        raise HTTPException(status_code=404, detail="Not Found")
+
+@app.get("/profiles", include_in_schema=False, dependencies=[Depends(require_profile_token)])
+async def list_profiles(limit: int = 20):
+    """List the most recent request profiles"""
+    return profiling.profile_store.recent(limit)
+
+@app.get("/profiles/{profile_id}", include_in_schema=False, dependencies=[Depends(require_profile_token)])
+async def get_profile(profile_id: str):
+    """Get a stored request profile"""
+    profile = profiling.profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
 @app.post("/analyze", response_model=SentimentAnalysisResponse)
 async def analyze_sentiment(request: SentimentAnalysisRequest):
     """Analyze sentiment of text"""
@@ -106,62 +329,162 @@ async def analyze_sentiment(request: SentimentAnalysisRequest):
         confidence=result["confidence"]
     )
 
-@app.get("/hotels", response_model=List[HotelResponse])
-async def get_hotels(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Get all hotels"""
-    hotels = models.get_hotels(db, skip=skip, limit=limit)
+@app.get("/hotels", response_model=List[SparseHotelResponse], response_model_exclude_unset=True)
+async def get_hotels(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    category: Optional[str] = None,
+    amenity: Optional[str] = None,
+    location: Optional[str] = None,
+    min_reviews: Optional[int] = Query(None, ge=0),
+    sort: str = Query("id", pattern="^(id|average_sentiment|total_reviews|name)$"),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get hotels, filtered and sorted, one page at a time
+    
+    Pass the X-Next-Cursor header of a response as `cursor` (with the same sort and order)
+    to fetch the next page. `fields` (e.g. `fields=name,location`) limits the fields returned
+    and the columns read from the database; the id is always included.
+    """
+    after = None
+    try:
+        field_names = models.parse_fields(fields, models.HOTEL_LIST_FIELDS)
+        if cursor:
+            after = models.decode_hotel_cursor(cursor, sort, order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # One row past the page tells whether there is a next page at all
+    hotels = models.get_hotels(
+        db, skip=skip, limit=limit + 1, category=category, amenity=amenity, location=location,
+        min_reviews=min_reviews, sort=sort, order=order, after=after, fields=field_names
+    )
+    if len(hotels) > limit:
+        hotels = hotels[:limit]
+        response.headers["X-Next-Cursor"] = models.encode_hotel_cursor(hotels[-1], sort, order)
+    
     return [
-        HotelResponse(
-            id=hotel.id,
-            name=hotel.name,
-            location=hotel.location,
-            description=hotel.description,
-            average_sentiment=hotel.average_sentiment,
-            total_reviews=hotel.total_reviews
-        )
+        SparseHotelResponse(**{name: getattr(hotel, name) for name in field_names or models.HOTEL_LIST_FIELDS})
         for hotel in hotels
     ]
 
-@app.get("/hotels/{hotel_id}", response_model=HotelDetailResponse)
-async def get_hotel(hotel_id: int, db: Session = Depends(get_db)):
-    """Get hotel details with all reviews"""
-    hotel = models.get_hotel(db, hotel_id=hotel_id)
+@app.get("/hotels/{hotel_id}", response_model=HotelDetailResponse, response_model_exclude_unset=True)
+async def get_hotel(
+    hotel_id: int,
+    fields: Optional[str] = None,
+    include: Optional[str] = Query(None, pattern="^reviews$"),
+    review_fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get hotel details with all reviews
+    
+    `fields` limits the hotel fields returned and the columns read (e.g. `fields=name,amenities`).
+    Reviews are embedded with `include=reviews`, or when neither `fields` nor `include` is given;
+    `review_fields` limits their fields the same way.
+    """
+    try:
+        field_names = models.parse_fields(fields, models.HOTEL_DETAIL_FIELDS)
+        review_field_names = models.parse_fields(review_fields, models.REVIEW_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    hotel = models.get_hotel(db, hotel_id=hotel_id, fields=field_names)
     if hotel is None:
         raise HTTPException(status_code=404, detail="Hotel not found")
     
-    reviews = models.get_hotel_reviews(db, hotel_id=hotel_id)
-    
-    return HotelDetailResponse(
-        id=hotel.id,
-        name=hotel.name,
-        location=hotel.location,
-        description=hotel.description,
-        average_sentiment=hotel.average_sentiment,
-        total_reviews=hotel.total_reviews,
-        reviews=[
-            ReviewResponse(
-                id=review.id,
-                hotel_id=review.hotel_id,
-                reviewer_name=review.reviewer_name,
-                review_text=review.review_text,
-                sentiment_label=review.sentiment_label,
-                sentiment_score=review.sentiment_score,
-                created_at=review.created_at.isoformat()
-            )
-            for review in reviews
+    values: Dict[str, Any] = {
+        name: getattr(hotel, name)
+        for name in field_names or models.HOTEL_DETAIL_FIELDS
+        if name != "amenities"
+    }
+    if field_names is None or "amenities" in field_names:
+        values["amenities"] = models.get_hotel_amenities(db, hotel_id=hotel.id)
+    if include == "reviews" or (fields is None and include is None):
+        reviews = models.get_hotel_reviews(db, hotel_id=hotel_id, fields=review_field_names)
+        values["reviews"] = [
+            review_response(review, SparseReviewResponse, fields=review_field_names) for review in reviews
         ]
-    )
+    
+    return HotelDetailResponse(**values)
+
+@app.get("/hotels/{hotel_id}/similar", response_model=List[SimilarHotelResponse])
+async def get_similar_hotels(
+    hotel_id: int,
+    limit: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Hotels whose guests say similar things (closest review-embedding centroids)"""
+    if models.get_hotel(db, hotel_id=hotel_id) is None:
+        raise HTTPException(status_code=404, detail="Hotel not found")
+    
+    matches = embedding_index.similar_hotels(hotel_id, limit=limit)
+    hotels = models.get_hotels_by_ids(db, [match_id for match_id, _ in matches])
+    similar = []
+    for match_id, similarity in matches:
+        hotel = hotels.get(match_id)
+        if hotel is None:
+            continue
+        similar.append(SimilarHotelResponse(
+            id=hotel.id,
+            name=hotel.name,
+            location=hotel.location,
+            description=hotel.description,
+            average_sentiment=hotel.average_sentiment,
+            total_reviews=hotel.total_reviews,
+            category=hotel.category,
+            price_range=hotel.price_range,
+            similarity=round(similarity, 4)
+        ))
+    return similar
 
 @app.post("/reviews", response_model=ReviewResponse)
-async def create_review(request: ReviewCreateRequest, db: Session = Depends(get_db)):
-    """Create a new review with sentiment analysis"""
+async def create_review(request: ReviewCreateRequest, response: Response, db: Session = Depends(get_db)):
+    """
+    Create a new review with sentiment analysis
+    
+    With REVIEW_INGESTION_MODE=write_behind the review is stored as PENDING and the call returns
+    202 without waiting for the model; poll GET /reviews/{review_id} for the score.
+    """
     # Check if hotel exists
     hotel = models.get_hotel(db, hotel_id=request.hotel_id)
     if hotel is None:
         raise HTTPException(status_code=404, detail="Hotel not found")
     
-    # Analyze sentiment
-    sentiment_result = sentiment_analyzer.analyze_sentiment(request.review_text)
+    # Near-duplicates reuse the original's sentiment instead of running the model again
+    signature, duplicate = None, None
+    if dedup.DEDUP_ENABLED:
+        signature, duplicate = dedup.check_review(db, request.hotel_id, request.review_text)
+    # Copies across hotels only share the score; within a hotel they do not count again
+    duplicate_of = duplicate.review_id if duplicate is not None and duplicate.hotel_id == request.hotel_id else None
+    
+    if duplicate is None or not duplicate.scored:
+        if WRITE_BEHIND:
+            review = models.create_review(
+                db=db,
+                hotel_id=request.hotel_id,
+                reviewer_name=request.reviewer_name,
+                review_text=request.review_text,
+                sentiment_label="PENDING",
+                sentiment_score=None,
+                signature=signature,
+                duplicate_of=duplicate_of,
+                sentiment_status="PENDING"
+            )
+            review_scoring.notify()
+            embedding_indexer.notify()
+            response.status_code = 202
+            return review_response(review)
+        
+        # Analyze sentiment
+        sentiment_result = sentiment_analyzer.analyze_sentiment(request.review_text)
+    else:
+        sentiment_result = duplicate.sentiment_result()
     
     if "error" in sentiment_result:
         raise HTTPException(
@@ -176,18 +499,45 @@ async def create_review(request: ReviewCreateRequest, db: Session = Depends(get_
         reviewer_name=request.reviewer_name,
         review_text=request.review_text,
         sentiment_label=sentiment_result["label"],
-        sentiment_score=sentiment_result["score"]
+        sentiment_score=sentiment_result["score"],
+        sentiment_model=sentiment_result.get("model_version"),
+        signature=signature,
+        duplicate_of=duplicate_of
     )
+    embedding_indexer.notify()
     
-    return ReviewResponse(
-        id=review.id,
-        hotel_id=review.hotel_id,
-        reviewer_name=review.reviewer_name,
-        review_text=review.review_text,
-        sentiment_label=review.sentiment_label,
-        sentiment_score=review.sentiment_score,
-        created_at=review.created_at.isoformat()
-    )
+    return review_response(review)
+
+@app.get("/reviews/search", response_model=List[ReviewSearchResult])
+async def search_reviews(
+    q: str = Query(..., min_length=1, max_length=1000),
+    limit: int = Query(10, ge=1, le=100),
+    hotel_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Reviews closest in meaning to a query, e.g. a complaint (optionally within one hotel)"""
+    if review_encoder is None:
+        raise HTTPException(status_code=503, detail="Review embeddings are disabled")
+    try:
+        query = await run_in_threadpool(encode_query, q)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    matches = embedding_index.search(query, limit=limit, hotel_id=hotel_id)
+    reviews = models.get_reviews_by_ids(db, [review_id for review_id, _ in matches])
+    return [
+        review_response(reviews[review_id], ReviewSearchResult, similarity=round(similarity, 4))
+        for review_id, similarity in matches
+        if review_id in reviews
+    ]
+
+@app.get("/reviews/{review_id}", response_model=ReviewResponse)
+async def get_review(review_id: int, db: Session = Depends(get_db)):
+    """Get a review, including whether its sentiment has been scored yet (sentiment_status)"""
+    review = models.get_review(db, review_id=review_id)
+    if review is None:
+        raise HTTPException(status_code=404, detail="Review not found")
+    return review_response(review)
 
 @app.post("/summarize", response_model=SummarizationResponse)
 async def summarize_reviews(request: SummarizationRequest, db: Session = Depends(get_db)):
@@ -217,8 +567,8 @@ async def summarize_reviews(request: SummarizationRequest, db: Session = Depends
             detail="Hotel not found"
         )
     
-    # Get all reviews for the hotel
-    reviews = models.get_hotel_reviews(db, hotel_id=hotel.id)
+    # Get all reviews for the hotel (near-duplicates add nothing to a summary)
+    reviews = models.get_hotel_reviews(db, hotel_id=hotel.id, include_duplicates=False)
     
     if not reviews:
         return SummarizationResponse(
@@ -232,11 +582,13 @@ async def summarize_reviews(request: SummarizationRequest, db: Session = Depends
     # Extract review texts
     review_texts = [review.review_text for review in reviews if review.review_text]
     
-    # Generate summary
-    summary_result = review_summarizer.summarize_reviews(
+    # Generate summary within the latency budget; waiting on it must not block the event loop
+    summary_result = await run_in_threadpool(
+        review_summarizer.summarize_reviews_with_deadline,
         review_texts,
         max_length=request.max_length,
-        min_length=request.min_length
+        min_length=request.min_length,
+        deadline_ms=request.deadline_ms
     )
     
     return SummarizationResponse(
@@ -246,9 +598,212 @@ async def summarize_reviews(request: SummarizationRequest, db: Session = Depends
         total_reviews=summary_result["total_reviews"],
         processed_reviews=summary_result["processed_reviews"],
         model_used=summary_result.get("model_used"),
-        error=summary_result.get("error")
+        error=summary_result.get("error"),
+        deadline_exceeded=summary_result.get("deadline_exceeded"),
+        abstractive_status=summary_result.get("abstractive_status"),
+        served_from_cache=summary_result.get("served_from_cache"),
+        timings_ms=summary_result.get("timings_ms")
+    )
+
+summary_streams_cancelled = metrics.registry.counter(
+    "summary_streams_cancelled_total", "Streamed summaries whose client went away before the end"
+)
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _single_summary_events(review_texts: List[str], max_length: int, min_length: int):
+    """The model server answers in one piece; send it as a single delta"""
+    result = review_summarizer.summarize_reviews(review_texts, max_length=max_length, min_length=min_length)
+    yield {"type": "delta", "text": result["summary"]}
+    yield dict(result, type="done")
+
+async def _watch_disconnect(request: Request, stop_event: threading.Event):
+    # A stream abandoned mid-way is not always closed promptly, so watch the client separately
+    while not stop_event.is_set():
+        if await request.is_disconnected():
+            if not stop_event.is_set():
+                stop_event.set()
+                summary_streams_cancelled.inc()
+            return
+        await asyncio.sleep(STREAM_DISCONNECT_POLL_SECONDS)
+
+async def _summary_event_stream(request: Request, hotel: Hotel, review_texts: List[str], max_length: int, min_length: int):
+    stop_event = threading.Event()
+    if isinstance(review_summarizer, ReviewSummarizer):
+        events = review_summarizer.stream_summary(review_texts, max_length, min_length, stop_event)
+    else:
+        events = _single_summary_events(review_texts, max_length, min_length)
+    watcher = asyncio.create_task(_watch_disconnect(request, stop_event))
+    
+    try:
+        yield _sse("start", {"hotel_id": hotel.id, "hotel_name": hotel.name, "total_reviews": len(review_texts)})
+        while not stop_event.is_set():
+            event = await run_in_threadpool(next, events, None)
+            if event is None:
+                break
+            if event.pop("type") == "delta":
+                yield _sse("token", event)
+            else:
+                event.update(hotel_id=hotel.id, hotel_name=hotel.name)
+                yield _sse("done", event)
+    finally:
+        # Stream over or abandoned: stop generating at the next decoding step
+        stop_event.set()
+        watcher.cancel()
+
+@app.get("/summarize/stream")
+async def stream_summary(
+    request: Request,
+    hotel_id: Optional[int] = None,
+    hotel_name: Optional[str] = None,
+    max_length: int = 100,
+    min_length: int = 20,
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a hotel's summary as it is generated (server-sent events)
+    
+    Sends a `start` event, `token` events with the text generated so far in small pieces, then
+    a `done` event with the full summary, model_used, review counts and timings. Generation
+    is cancelled when the client disconnects.
+    """
+    if not hotel_id and not hotel_name:
+        raise HTTPException(status_code=400, detail="Either hotel_id or hotel_name must be provided")
+    
+    hotel = None
+    if hotel_id:
+        hotel = models.get_hotel(db, hotel_id=hotel_id)
+    elif hotel_name:
+        hotel = models.get_hotel_by_name(db, hotel_name=hotel_name)
+    if hotel is None:
+        raise HTTPException(status_code=404, detail="Hotel not found")
+    
+    reviews = models.get_hotel_reviews(db, hotel_id=hotel.id, include_duplicates=False)
+    review_texts = [review.review_text for review in reviews if review.review_text]
+    
+    return StreamingResponse(
+        _summary_event_stream(request, hotel, review_texts, max_length, min_length),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
+@app.post("/summarize/compare", response_model=CompareSummariesResponse)
+async def compare_hotel_summaries(request: CompareSummariesRequest, db: Session = Depends(get_db)):
+    """
+    Summarize several hotels side by side
+    
+    Review texts for all hotels are read in one query and the summaries are generated
+    in batched calls, instead of one /summarize request per hotel.
+    """
+    if not request.hotel_ids and not request.location:
+        raise HTTPException(status_code=400, detail="Either hotel_ids or location must be provided")
+    if request.hotel_ids and len(request.hotel_ids) > COMPARE_MAX_HOTELS:
+        raise HTTPException(status_code=400, detail=f"At most {COMPARE_MAX_HOTELS} hotels can be compared")
+    
+    start = time.perf_counter()
+    if request.hotel_ids:
+        found = {hotel.id: hotel for hotel in db.query(Hotel).filter(Hotel.id.in_(request.hotel_ids))}
+        missing = [hotel_id for hotel_id in request.hotel_ids if hotel_id not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Hotels not found: {missing}")
+        hotels = [found[hotel_id] for hotel_id in dict.fromkeys(request.hotel_ids)]
+    else:
+        hotels = models.get_hotels(
+            db, limit=COMPARE_MAX_HOTELS, location=request.location, sort="total_reviews", order="desc"
+        )
+        if not hotels:
+            raise HTTPException(status_code=404, detail="No hotels found at this location")
+    
+    hotel_ids = [hotel.id for hotel in hotels]
+    review_texts = models.get_review_texts_by_hotel(db, hotel_ids)
+    sentiment_counts = models.get_sentiment_counts_by_hotel(db, hotel_ids)
+    query_ms = round((time.perf_counter() - start) * 1000, 1)
+    
+    summarize_start = time.perf_counter()
+    # Blocks until the summarizer's generation thread gets to it, so keep it off the event loop
+    summaries = await run_in_threadpool(
+        review_summarizer.summarize_reviews_batch,
+        [review_texts[hotel_id] for hotel_id in hotel_ids],
+        max_length=request.max_length,
+        min_length=request.min_length
+    )
+    summarize_ms = round((time.perf_counter() - summarize_start) * 1000, 1)
+    
+    comparisons = []
+    for hotel, summary_result in zip(hotels, summaries):
+        counts = sentiment_counts[hotel.id]
+        comparisons.append(HotelComparison(
+            hotel_id=hotel.id,
+            hotel_name=hotel.name,
+            location=hotel.location,
+            summary=summary_result["summary"],
+            average_sentiment=hotel.average_sentiment or 0.0,
+            total_reviews=summary_result["total_reviews"],
+            processed_reviews=summary_result["processed_reviews"],
+            positive_reviews=counts.get("POSITIVE", 0),
+            negative_reviews=counts.get("NEGATIVE", 0),
+            neutral_reviews=counts.get("NEUTRAL", 0),
+            model_used=summary_result.get("model_used"),
+            served_from_cache=summary_result.get("served_from_cache"),
+            error=summary_result.get("error")
+        ))
+    
+    return CompareSummariesResponse(
+        hotels=comparisons,
+        total_hotels=len(comparisons),
+        timings_ms={"query_ms": query_ms, "summarize_ms": summarize_ms}
+    )
+
+@app.post("/summarize/jobs", response_model=SummaryJobResponse, status_code=202)
+async def create_summary_job(request: SummaryJobRequest, db: Session = Depends(get_db)):
+    """
+    Queue a background summarization job and return its id immediately
+    
+    Identical pending or running jobs are reused instead of queued twice.
+    """
+    if request.all_hotels:
+        job = summary_jobs.submit(
+            db,
+            kind="all_hotels",
+            max_length=request.max_length,
+            min_length=request.min_length
+        )
+        return _summary_job_response(job)
+    
+    if not request.hotel_id and not request.hotel_name:
+        raise HTTPException(
+            status_code=400, 
+            detail="Either hotel_id, hotel_name or all_hotels must be provided"
+        )
+    
+    hotel = None
+    if request.hotel_id:
+        hotel = models.get_hotel(db, hotel_id=request.hotel_id)
+    elif request.hotel_name:
+        hotel = models.get_hotel_by_name(db, hotel_name=request.hotel_name)
+    
+    if hotel is None:
+        raise HTTPException(status_code=404, detail="Hotel not found")
+    
+    job = summary_jobs.submit(
+        db,
+        kind="hotel",
+        hotel_id=hotel.id,
+        max_length=request.max_length,
+        min_length=request.min_length
+    )
+    return _summary_job_response(job)
+
+@app.get("/summarize/jobs/{job_id}", response_model=SummaryJobResponse)
+async def get_summary_job(job_id: int, db: Session = Depends(get_db)):
+    """Get the status and, once finished, the result of a summarization job"""
+    job = models.get_summary_job(db, job_id=job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _summary_job_response(job)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
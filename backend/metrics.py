@@ -0,0 +1,322 @@
+"""
+In-process metrics for the Hotel Review API
+Counters, gauges and histograms rendered in the Prometheus text format at /metrics
+"""
+
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Default latency buckets in seconds (covers fast DB reads up to slow generations)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    """Render a label set as {a="x",b="y"}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down (queue depth, in-flight work)"""
+
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels) -> "_Timer":
+        """Context manager observing the elapsed wall-clock time"""
+        return _Timer(self, labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self._start
+        self.histogram.observe(self.elapsed, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds every metric and renders the /metrics payload"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry
+registry = MetricsRegistry()
+
+# HTTP
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+http_errors = registry.counter(
+    "http_errors_total", "HTTP responses with a 5xx status or an unhandled exception", ("method", "route")
+)
+
+# Inference
+inference_duration = registry.histogram(
+    "inference_duration_seconds", "Model inference time", ("task",)
+)
+inference_batch_size = registry.histogram(
+    "inference_batch_size", "Number of texts per inference call", ("task",), buckets=SIZE_BUCKETS
+)
+inference_queue_depth = registry.gauge(
+    "inference_queue_depth", "Inference calls waiting or running", ("task",)
+)
+inference_errors = registry.counter(
+    "inference_errors_total", "Inference calls that raised an error", ("task",)
+)
+summaries_by_model = registry.counter(
+    "summaries_total", "Summaries generated by model (extractive_fallback included)", ("model_used",)
+)
+
+# Database
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "SQL statement execution time", ("operation",)
+)
+db_queries_per_request = registry.histogram(
+    "db_queries_per_request", "Number of SQL statements issued per HTTP request", ("route",), buckets=SIZE_BUCKETS
+)
+db_time_per_request = registry.histogram(
+    "db_time_per_request_seconds", "Total SQL time spent per HTTP request", ("route",)
+)
+
+# Per-request SQL accounting: [query count, total seconds]
+_request_queries: ContextVar[Optional[List[float]]] = ContextVar("request_queries", default=None)
+
+
+def start_request_tracking() -> object:
+    """Begin counting SQL statements for the current request"""
+    return _request_queries.set([0, 0.0])
+
+
+def finish_request_tracking(token: object, route: str):
+    """Record the SQL totals collected for the current request"""
+    stats = _request_queries.get()
+    _request_queries.reset(token)
+    if stats is not None:
+        db_queries_per_request.observe(stats[0], route=route)
+        db_time_per_request.observe(stats[1], route=route)
+
+
+class track_inference:
+    """Context manager recording latency, batch size and queue depth for one model call"""
+
+    def __init__(self, task: str, batch_size: int = 1):
+        self.task = task
+        self.batch_size = batch_size
+
+    def __enter__(self):
+        inference_queue_depth.inc(task=self.task)
+        inference_batch_size.observe(self.batch_size, task=self.task)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        inference_duration.observe(time.perf_counter() - self._start, task=self.task)
+        inference_queue_depth.dec(task=self.task)
+        if exc_type is not None:
+            inference_errors.inc(task=self.task)
+        return False
+
+
+def instrument_engine(engine: Engine, *observers: Callable[[str, Any, float], None]):
+    """
+    Attach SQLAlchemy hooks timing every statement executed on the engine
+
+    This is the engine's only timing pair: each observer (e.g. the profiler) is called with the
+    statement, its parameters and the elapsed seconds instead of keeping its own start times.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append((id(context), time.perf_counter()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start_time")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()[1]
+        operation = statement.lstrip().split(" ", 1)[0].upper() or "UNKNOWN"
+        db_query_duration.observe(elapsed, operation=operation)
+        stats = _request_queries.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += elapsed
+        for observer in observers:
+            observer(statement, parameters, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # after_cursor_execute never fires for a failed statement; drop its start time so the
+        # pooled connection's stack does not grow and pair later statements with stale starts
+        conn = exception_context.connection
+        if conn is None:
+            return
+        starts = conn.info.get("query_start_time")
+        # Only when the failure is the statement on top of the stack, not e.g. a later fetch
+        if starts and starts[-1][0] == id(exception_context.execution_context):
+            starts.pop()
@@ -4,7 +4,8 @@ Handles database schema creation and seeding
 """
 
 from sqlalchemy import create_engine, text
-from database import Base, engine, SessionLocal
+from database import Base, engine, SessionLocal, Hotel, Review
+from catalog import DEFAULT_CATALOG_PATH, load_catalog
 import models
 
 def create_tables():
@@ -25,38 +26,9 @@ def seed_sample_data():
 
         print("Seeding sample hotels...")
         
-        # Sample hotels data
-        sample_hotels = [
-            {
-                "name": "Grand Plaza Hotel",
-                "location": "New York, NY",
-                "description": "Luxury hotel in the heart of Manhattan with stunning city views."
-            },
-            {
-                "name": "Ocean Breeze Resort",
-                "location": "Miami, FL", 
-                "description": "Beachfront resort with world-class amenities and spa services."
-            },
-            {
-                "name": "Mountain View Lodge",
-                "location": "Aspen, CO",
-                "description": "Cozy mountain lodge perfect for skiing and outdoor adventures."
-            },
-            {
-                "name": "Downtown Business Hotel",
-                "location": "Chicago, IL",
-                "description": "Modern business hotel with conference facilities and fine dining."
-            },
-            {
-                "name": "Historic Boutique Inn",
-                "location": "Charleston, SC",
-                "description": "Charming historic inn with southern hospitality and antique furnishings."
-            }
-        ]
-        
-        # Create hotels
-        for hotel_data in sample_hotels:
-            models.create_hotel(db, **hotel_data)
+        # Load the hotel catalog (data/hotels.json) in batched upserts
+        load_catalog(db=db)
+        hotel_ids = {hotel.external_id: hotel.id for hotel in db.query(Hotel.external_id, Hotel.id)}
         
         print("✅ Sample hotels seeded successfully")
         
@@ -85,8 +57,13 @@ def seed_sample_data():
             }
         ]
         
-        for review_data in sample_reviews:
-            models.create_review(db, **review_data)
+        # One transaction for all reviews, then recompute hotel aggregates once
+        db.add_all([
+            Review(**dict(review_data, hotel_id=hotel_ids[str(review_data["hotel_id"])]))
+            for review_data in sample_reviews
+        ])
+        db.commit()
+        models.recompute_hotel_aggregates(db)
             
         print("✅ Sample reviews seeded successfully")
         
@@ -105,13 +82,11 @@ def reset_database():
     print("✅ Database reset complete")
 
 def backup_data():
-    """Export current data to SQL file"""
-    import os
-    backup_file = "database_backup.sql"
+    """Write a compressed online snapshot of the database"""
+    from backup import backup_database
     
-    # Use sqlite3 command to create backup
-    db_path = "hotel_reviews.db" 
-    os.system(f"sqlite3 {db_path} .dump > {backup_file}")
+    # VACUUM INTO reads one consistent snapshot, so writers are not blocked
+    backup_file = backup_database()
     print(f"✅ Database backed up to {backup_file}")
 
 if __name__ == "__main__":
@@ -128,11 +103,16 @@ if __name__ == "__main__":
             reset_database()
         elif command == "backup":
             backup_data()
+        elif command == "catalog":
+            catalog_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CATALOG_PATH
+            count = load_catalog(catalog_path)
+            print(f"✅ Upserted {count} hotels from {catalog_path}")
         else:
-            print("Usage: python migrations.py [create|seed|reset|backup]")
+            print("Usage: python migrations.py [create|seed|reset|backup|catalog]")
     else:
         print("Available commands:")
         print("  python migrations.py create  - Create database tables")
         print("  python migrations.py seed    - Seed sample data") 
         print("  python migrations.py reset   - Reset database (DELETES ALL DATA)")
-        print("  python migrations.py backup  - Backup database to SQL file")
+        print("  python migrations.py backup  - Backup database to a compressed snapshot")
+        print("  python migrations.py catalog [path] - Upsert a hotel catalog (default data/hotels.json)")
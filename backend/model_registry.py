@@ -0,0 +1,213 @@
+"""
+Local model registry
+Prepares pinned, versioned model artifacts once (safetensors weights plus a pre-built fast
+tokenizer) so the analyzers can start from local, memory-mappable files instead of resolving
+models from the Hugging Face hub on every cold start.
+
+Usage:
+    python model_registry.py prepare [sentiment|summarization|embedding|all]
+    python model_registry.py list
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", os.getenv("MODEL_CACHE_DIR", "./models"))
+# Offline mode: load only from the registry, never from the hub
+MODEL_OFFLINE = os.getenv("MODEL_OFFLINE", "false").lower() == "true"
+
+MODEL_SPECS: Dict[str, Dict[str, str]] = {
+    "sentiment": {
+        "name": os.getenv("SENTIMENT_MODEL", "distilbert-base-uncased-finetuned-sst-2-english"),
+        "revision": os.getenv("SENTIMENT_MODEL_REVISION", "main"),
+        "auto_class": "AutoModelForSequenceClassification",
+    },
+    "summarization": {
+        "name": os.getenv("SUMMARIZATION_MODEL", "t5-small"),
+        "revision": os.getenv("SUMMARIZATION_MODEL_REVISION", "main"),
+        "auto_class": "AutoModelForSeq2SeqLM",
+    },
+    "embedding": {
+        "name": os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+        "revision": os.getenv("EMBEDDING_MODEL_REVISION", "main"),
+        "auto_class": "AutoModel",
+    },
+}
+
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+if MODEL_OFFLINE:
+    # Make any accidental hub lookup fail fast instead of hanging on the network. transformers
+    # reads these when it is imported, so this module must be imported before it
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+class ModelNotPreparedError(RuntimeError):
+    """Raised in offline mode when a model has not been prepared in the registry"""
+
+
+def _model_dir(key: str) -> str:
+    return os.path.join(MODEL_REGISTRY_DIR, key)
+
+
+def current_version(key: str) -> Optional[str]:
+    """Version of the artifact the analyzers should load, if one has been prepared"""
+    pointer = os.path.join(_model_dir(key), CURRENT_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r") as f:
+        version = f.read().strip()
+    return version if os.path.isdir(os.path.join(_model_dir(key), version)) else None
+
+
+def load_manifest(key: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    version = version or current_version(key)
+    if version is None:
+        return None
+    with open(os.path.join(_model_dir(key), version, MANIFEST_FILE), "r") as f:
+        return json.load(f)
+
+
+def model_source(key: str) -> str:
+    """
+    Path or hub name to pass to transformers for the given model
+
+    Returns the prepared local artifact when there is one. Otherwise falls back to the hub
+    name, unless offline mode is on.
+    """
+    version = current_version(key)
+    if version is not None:
+        return os.path.join(_model_dir(key), version)
+    if MODEL_OFFLINE:
+        raise ModelNotPreparedError(
+            f"Model '{key}' is not in the registry at {MODEL_REGISTRY_DIR}; "
+            f"run `python model_registry.py prepare {key}`"
+        )
+    return MODEL_SPECS[key]["name"]
+
+
+def model_version(key: str) -> str:
+    """Identifier of the model the analyzers load, recorded next to stored predictions"""
+    manifest = load_manifest(key)
+    if manifest is not None:
+        return f"{manifest['name']}@{manifest['commit'][:12]}"
+    spec = MODEL_SPECS[key]
+    return f"{spec['name']}@{spec['revision']}"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare(key: str) -> str:
+    """
+    Download the pinned model once and store it as a versioned local artifact
+
+    A published version directory is never modified: running workers may have its weights
+    memory-mapped. A new version is staged next to it and CURRENT is switched atomically.
+    """
+    import transformers
+
+    spec = MODEL_SPECS[key]
+    auto_class = getattr(transformers, spec["auto_class"])
+    print(f"Preparing {key}: {spec['name']}@{spec['revision']}...")
+
+    model = auto_class.from_pretrained(spec["name"], revision=spec["revision"])
+    tokenizer = transformers.AutoTokenizer.from_pretrained(spec["name"], revision=spec["revision"], use_fast=True)
+
+    # Version by the resolved hub commit so the same pin always maps to the same directory
+    commit = getattr(model.config, "_commit_hash", None) or datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    version = commit[:12]
+    target = os.path.join(_model_dir(key), version)
+    if os.path.exists(os.path.join(target, MANIFEST_FILE)):
+        _publish(key, version)
+        print(f"✅ {key} already prepared at {target}")
+        return target
+
+    os.makedirs(_model_dir(key), exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f"{version}.", suffix=".tmp", dir=_model_dir(key))
+
+    # safetensors weights can be memory-mapped at load time instead of unpickled into RAM
+    model.save_pretrained(staging, safe_serialization=True)
+    tokenizer.save_pretrained(staging)
+
+    manifest = {
+        "key": key,
+        "name": spec["name"],
+        "revision": spec["revision"],
+        "commit": commit,
+        "version": version,
+        "auto_class": spec["auto_class"],
+        "transformers_version": transformers.__version__,
+        "created_at": datetime.utcnow().isoformat(),
+        "files": {
+            name: _sha256(os.path.join(staging, name))
+            for name in sorted(os.listdir(staging))
+        },
+    }
+    with open(os.path.join(staging, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    try:
+        os.rename(staging, target)
+    except OSError:
+        # Published meanwhile by a concurrent prepare; same pinned commit, so keep theirs
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(target, MANIFEST_FILE)):
+            raise
+    _publish(key, version)
+
+    print(f"✅ {key} prepared at {target}")
+    return target
+
+
+def _publish(key: str, version: str):
+    """Point CURRENT at a version; readers see either the old or the new pointer, never a mix"""
+    pointer = os.path.join(_model_dir(key), CURRENT_FILE)
+    temp_pointer = f"{pointer}.{os.getpid()}.tmp"
+    with open(temp_pointer, "w") as f:
+        f.write(version)
+    os.replace(temp_pointer, pointer)
+
+
+def list_models():
+    for key in MODEL_SPECS:
+        manifest = load_manifest(key)
+        if manifest is None:
+            print(f"  {key:<14} not prepared")
+        else:
+            print(f"  {key:<14} {manifest['name']}@{manifest['commit'][:12]} (prepared {manifest['created_at']})")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "prepare":
+        target_key = sys.argv[2] if len(sys.argv) > 2 else "all"
+        keys = list(MODEL_SPECS) if target_key == "all" else [target_key]
+        for model_key in keys:
+            if model_key not in MODEL_SPECS:
+                print(f"❌ Unknown model '{model_key}'. Choose from: {', '.join(MODEL_SPECS)}")
+                sys.exit(1)
+            prepare(model_key)
+    elif len(sys.argv) > 1 and sys.argv[1] == "list":
+        list_models()
+    else:
+        print("Available commands:")
+        print("  python model_registry.py prepare [sentiment|summarization|embedding|all]  - Prepare local model artifacts")
+        print("  python model_registry.py list                                              - Show prepared models")
@@ -0,0 +1,372 @@
+"""
+Shared local model server
+One process owns the sentiment, summarization and embedding models and serves every API worker
+over a Unix socket, so memory per node stays flat as uvicorn workers are added.
+
+Run it with:  python model_server.py
+Then start the API with MODEL_SERVER_MODE=remote.
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Configuration
+MODEL_SERVER_MODE = os.getenv("MODEL_SERVER_MODE", "local")  # "local" or "remote"
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "/tmp/hotel_review_models.sock")
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "120"))
+MODEL_SERVER_POOL_SIZE = int(os.getenv("MODEL_SERVER_POOL_SIZE", "4"))
+MODEL_SERVER_RETRY_SECONDS = float(os.getenv("MODEL_SERVER_RETRY_SECONDS", "5"))
+# Load a model in-process while the server is down (costs a full model copy per worker)
+MODEL_SERVER_LOCAL_FALLBACK = os.getenv("MODEL_SERVER_LOCAL_FALLBACK", "false").lower() == "true"
+MODEL_SERVER_MAX_BATCH = int(os.getenv("MODEL_SERVER_MAX_BATCH", "32"))
+MODEL_SERVER_BATCH_WAIT_MS = float(os.getenv("MODEL_SERVER_BATCH_WAIT_MS", "5"))
+
+_HEADER = struct.Struct(">I")
+
+model_server_calls = metrics.registry.counter(
+    "model_server_calls_total", "Calls sent to the shared model server", ("model", "method")
+)
+model_server_fallbacks = metrics.registry.counter(
+    "model_server_fallbacks_total", "Calls served in-process because the model server was unavailable",
+    ("model", "method")
+)
+
+
+class ModelServerUnavailable(ConnectionError):
+    """The model server cannot be reached and no in-process fallback is allowed"""
+
+
+class ModelServerTimeout(TimeoutError):
+    """The model server is reachable but did not answer within MODEL_SERVER_TIMEOUT"""
+
+
+def use_model_server() -> bool:
+    """Whether API workers should send inference to the shared model server"""
+    return MODEL_SERVER_MODE == "remote"
+
+
+# Wire protocol: 4-byte big-endian length followed by a UTF-8 JSON document
+
+def send_message(sock: socket.socket, payload: Dict[str, Any]):
+    data = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    data = _recv_exact(sock, length)
+    if data is None:
+        raise ConnectionError("Connection closed mid-message")
+    return json.loads(data.decode("utf-8"))
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(remaining)
+        if not chunk:
+            if remaining == size:
+                return None
+            raise ConnectionError("Connection closed mid-message")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+# Client side
+
+class ModelServerClient:
+    """Pooled connections to the model server"""
+
+    def __init__(self, socket_path: str = MODEL_SERVER_SOCKET, pool_size: int = MODEL_SERVER_POOL_SIZE,
+                 timeout: float = MODEL_SERVER_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._pool: "queue.LifoQueue[socket.socket]" = queue.LifoQueue(maxsize=pool_size)
+        self._down_until = 0.0
+
+    def available(self) -> bool:
+        """False while backing off after a failed connection"""
+        return time.monotonic() >= self._down_until
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _pooled(self) -> Optional[socket.socket]:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _release(self, sock: socket.socket):
+        try:
+            self._pool.put_nowait(sock)
+        except queue.Full:
+            sock.close()
+
+    def call(self, model: str, method: str, *args, **kwargs) -> Any:
+        """
+        Invoke a method on a server-side model
+
+        A pooled connection that turns out to be dead (e.g. the server restarted) is retried once
+        on a fresh connection. Raises ConnectionError only when the server cannot be reached,
+        and ModelServerTimeout when it is reachable but the call takes longer than the timeout.
+        """
+        if not self.available():
+            raise ConnectionError("Model server marked unavailable")
+        payload = {"model": model, "method": method, "args": args, "kwargs": kwargs}
+
+        sock = self._pooled()
+        if sock is not None:
+            try:
+                response = self._exchange(sock, payload)
+            except ModelServerTimeout:
+                raise
+            except ConnectionError:
+                response = None  # Stale pooled connection: retry below on a fresh one
+            if response is not None:
+                return self._result(response)
+
+        try:
+            sock = self._connect()
+        except OSError as e:
+            self._down_until = time.monotonic() + MODEL_SERVER_RETRY_SECONDS
+            raise ConnectionError(f"Cannot connect to model server: {e}")
+        try:
+            response = self._exchange(sock, payload)
+        except ConnectionError:
+            self._down_until = time.monotonic() + MODEL_SERVER_RETRY_SECONDS
+            raise
+        if response is None:
+            self._down_until = time.monotonic() + MODEL_SERVER_RETRY_SECONDS
+            raise ConnectionError("Model server closed the connection")
+        return self._result(response)
+
+    def _exchange(self, sock: socket.socket, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Send one request and read its response; the socket goes back to the pool only on success"""
+        try:
+            send_message(sock, payload)
+            response = recv_message(sock)
+        except socket.timeout:
+            # The server is alive but slow; the connection is out of step, so drop it
+            sock.close()
+            raise ModelServerTimeout(f"Model server call timed out after {self.timeout}s")
+        except (OSError, ValueError) as e:
+            sock.close()
+            raise ConnectionError(f"Model server call failed: {e}")
+        if response is None:
+            sock.close()
+            return None
+        self._release(sock)
+        return response
+
+    @staticmethod
+    def _result(response: Dict[str, Any]) -> Any:
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+
+_client: Optional[ModelServerClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ModelServerClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ModelServerClient()
+        return _client
+
+
+class RemoteModelProxy:
+    """
+    Stand-in for an analyzer that forwards calls to the model server.
+    If the server cannot be reached, calls raise ModelServerUnavailable; with
+    MODEL_SERVER_LOCAL_FALLBACK the real analyzer is loaded in-process instead, and dropped again
+    once the server answers. Only remote_methods are exposed, plus the local_attributes read from
+    the in-process analyzer when the fallback is enabled; any other attribute raises
+    AttributeError rather than quietly loading the model into the API process.
+    """
+
+    def __init__(self, model: str, local_factory: Callable[[], Any], remote_methods: Tuple[str, ...],
+                 local_fallback: bool = MODEL_SERVER_LOCAL_FALLBACK, local_attributes: Tuple[str, ...] = ()):
+        self._model = model
+        self._local_factory = local_factory
+        self._remote_methods = set(remote_methods)
+        self._local_fallback = local_fallback
+        self._local_attributes = set(local_attributes)
+        self._local = None
+        self._local_lock = threading.Lock()
+
+    def _local_instance(self):
+        with self._local_lock:
+            if self._local is None:
+                logger.warning(f"Loading {self._model} model in-process")
+                self._local = self._local_factory()
+            return self._local
+
+    def _drop_local_instance(self):
+        with self._local_lock:
+            if self._local is not None:
+                logger.info(f"Model server is back, unloading in-process {self._model} model")
+                self._local = None
+
+    def __getattr__(self, name: str):
+        if name.startswith("_") or name not in self._remote_methods:
+            if self._local_fallback and name in self._local_attributes:
+                return getattr(self._local_instance(), name)
+            raise AttributeError(f"'{name}' is not served by the {self._model} model server")
+
+        def call(*args, **kwargs):
+            try:
+                result = get_client().call(self._model, name, *args, **kwargs)
+            except ConnectionError as e:
+                if not self._local_fallback:
+                    raise ModelServerUnavailable(f"Model server unavailable for {self._model}: {e}")
+                logger.warning(f"Model server unavailable, using in-process {self._model}: {e}")
+                model_server_fallbacks.inc(model=self._model, method=name)
+                return getattr(self._local_instance(), name)(*args, **kwargs)
+            model_server_calls.inc(model=self._model, method=name)
+            if self._local is not None:
+                self._drop_local_instance()
+            return result
+
+        return call
+
+
+# Server side
+
+class SentimentBatcher:
+    """Coalesces concurrent single-text sentiment requests into batched forward passes"""
+
+    def __init__(self, analyzer, max_batch: int = MODEL_SERVER_MAX_BATCH,
+                 wait_ms: float = MODEL_SERVER_BATCH_WAIT_MS):
+        self.analyzer = analyzer
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000.0
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        threading.Thread(target=self._run, name="sentiment-batcher", daemon=True).start()
+
+    def submit(self, text: str) -> Dict[str, Any]:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                results = self.analyzer.analyze_sentiment_batch(texts, batch_size=len(texts))
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, models: Dict[str, Any]):
+        self.models = models
+        self.batcher = SentimentBatcher(models["sentiment"])
+        super().__init__(socket_path, ModelRequestHandler)
+
+    def dispatch(self, model: str, method: str, args: List[Any], kwargs: Dict[str, Any]) -> Any:
+        if model == "sentiment" and method == "analyze_sentiment" and not kwargs:
+            return self.batcher.submit(*args)
+
+        target = self.models.get(model)
+        if target is None or method.startswith("_") or not hasattr(target, method):
+            raise ValueError(f"Unknown model method {model}.{method}")
+        # Summarization queues on the summarizer's own single-worker executor, one generation at a time
+        return getattr(target, method)(*args, **kwargs)
+
+
+class ModelRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Connections are pooled by the clients, so serve requests until the peer hangs up
+        while True:
+            try:
+                message = recv_message(self.request)
+            except (OSError, ValueError):
+                return
+            if message is None:
+                return
+            try:
+                result = self.server.dispatch(
+                    message["model"], message["method"], message.get("args", []), message.get("kwargs", {})
+                )
+                response = {"result": result}
+            except Exception as e:
+                logger.error(f"Model server error in {message.get('model')}.{message.get('method')}: {e}")
+                response = {"error": str(e)}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+def serve(socket_path: str = MODEL_SERVER_SOCKET):
+    """Load the models once and serve them over a Unix socket"""
+    # Import here so the analyzer modules build real in-process models, not proxies
+    os.environ["MODEL_SERVER_MODE"] = "local"
+    from sentiment import transformer_analyzer
+    from summarization import review_summarizer
+    from embeddings import review_encoder
+
+    models = {
+        # The transformer itself: API workers apply the lexicon cascade before calling the server
+        "sentiment": transformer_analyzer,
+        "summarization": review_summarizer,
+    }
+    if review_encoder is not None:
+        models["embedding"] = review_encoder
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with ModelServer(socket_path, models) as server:
+        logger.info(f"Model server listening on {socket_path}")
+        try:
+            server.serve_forever()
+        finally:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    serve()
@@ -1,14 +1,164 @@
-from sqlalchemy.orm import Session
-from database import Hotel, Review
-from typing import List, Optional
+from sqlalchemy import and_, func, or_, tuple_, update
+from sqlalchemy.orm import Session, load_only
+from database import Hotel, HotelAmenity, Review, SummaryJob
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from datetime import datetime
+import base64
+import json
+from catalog import load_catalog
+import dedup
 
-def get_hotels(db: Session, skip: int = 0, limit: int = 100) -> List[Hotel]:
-    """Get all hotels with pagination"""
-    return db.query(Hotel).offset(skip).limit(limit).all()
+# Sort keys accepted by get_hotels; each has a listing index ending in the primary key
+HOTEL_SORT_COLUMNS = {
+    "id": Hotel.id,
+    "average_sentiment": Hotel.average_sentiment,
+    "total_reviews": Hotel.total_reviews,
+    "name": Hotel.name,
+}
 
-def get_hotel(db: Session, hotel_id: int) -> Optional[Hotel]:
-    """Get a specific hotel by ID"""
-    return db.query(Hotel).filter(Hotel.id == hotel_id).first()
+# Fields a client can request with `fields=`; all but amenities map to a column of the same name
+HOTEL_LIST_FIELDS = (
+    "id", "name", "location", "description", "average_sentiment", "total_reviews", "category", "price_range"
+)
+HOTEL_DETAIL_FIELDS = HOTEL_LIST_FIELDS + ("phone", "email", "website", "amenities")
+REVIEW_FIELDS = (
+    "id", "hotel_id", "reviewer_name", "review_text", "sentiment_label", "sentiment_score",
+    "created_at", "duplicate_of", "sentiment_status"
+)
+
+def parse_fields(fields: Optional[str], allowed: Sequence[str]) -> Optional[List[str]]:
+    """
+    Parse a comma-separated sparse fieldset; None means every field
+    
+    The id is always included. Raises ValueError for unknown field names.
+    """
+    if fields is None:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Available: {', '.join(allowed)}")
+    return ["id"] + [name for name in dict.fromkeys(names) if name != "id"]
+
+def _only_columns(model, fields: Iterable[str]):
+    """Loader option reading just the columns behind the given fields (plus the primary key)"""
+    columns = model.__table__.columns
+    return load_only(*[getattr(model, name) for name in fields if name in columns])
+
+def counted_reviews():
+    """Filter for reviews that count towards hotel sentiment: scored, and not near-duplicates"""
+    return and_(
+        Review.duplicate_of.is_(None),
+        or_(Review.sentiment_status.is_(None), Review.sentiment_status == "DONE")
+    )
+
+def encode_hotel_cursor(hotel: Hotel, sort: str, order: str) -> str:
+    """Opaque cursor pointing just past the given hotel in this sort order"""
+    key = [getattr(hotel, sort), hotel.id]
+    payload = json.dumps({"sort": sort, "order": order, "key": key}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_hotel_cursor(cursor: str, sort: str, order: str) -> Tuple[Any, int]:
+    """Return the (sort value, id) keyset position; raises ValueError for invalid cursors"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        value, hotel_id = payload["key"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if payload.get("sort") != sort or payload.get("order") != order:
+        raise ValueError("Cursor was issued for a different sort order")
+    return value, int(hotel_id)
+
+def _after_sort_key(sort_column, value: Any, last_id: int, descending: bool):
+    """
+    Keyset filter for rows after (value, last_id)
+    
+    SQLite sorts NULLs first ascending and last descending; a plain row-value comparison
+    is never true for NULL, so hotels without a sort value need their own branch.
+    """
+    if value is None:
+        if descending:
+            return and_(sort_column.is_(None), Hotel.id < last_id)
+        return or_(sort_column.is_not(None), and_(sort_column.is_(None), Hotel.id > last_id))
+    position, bound = tuple_(sort_column, Hotel.id), tuple_(value, last_id)
+    if descending:
+        return or_(position < bound, sort_column.is_(None))
+    return position > bound
+
+def get_hotels(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    category: Optional[str] = None,
+    amenity: Optional[str] = None,
+    location: Optional[str] = None,
+    min_reviews: Optional[int] = None,
+    sort: str = "id",
+    order: str = "asc",
+    after: Optional[Tuple[Any, int]] = None,
+    fields: Optional[Sequence[str]] = None
+) -> List[Hotel]:
+    """
+    Get a page of hotels, filtered and sorted
+    
+    Pages continue from the keyset position `after` ((sort value, id) of the last hotel seen),
+    so deep pages cost the same as the first one. `skip` is kept for older clients.
+    With `fields`, only those columns (plus the sort key) are read; other attributes are unloaded.
+    """
+    sort_column = HOTEL_SORT_COLUMNS[sort]
+    descending = order == "desc"
+    
+    # Phase 1: resolve the page's ids from a covering listing index
+    query = db.query(Hotel.id)
+    if category:
+        query = query.filter(Hotel.category == category)
+    if amenity:
+        query = query.filter(Hotel.id.in_(
+            db.query(HotelAmenity.hotel_id).filter(HotelAmenity.amenity == amenity)
+        ))
+    if location:
+        query = query.filter(Hotel.location == location)
+    if min_reviews:
+        query = query.filter(Hotel.total_reviews >= min_reviews)
+    if after is not None:
+        value, last_id = after
+        if sort == "id":
+            query = query.filter(Hotel.id < last_id if descending else Hotel.id > last_id)
+        else:
+            query = query.filter(_after_sort_key(sort_column, value, last_id, descending))
+    
+    if sort == "id":
+        ordering = [Hotel.id.desc() if descending else Hotel.id]
+    elif descending:
+        ordering = [sort_column.desc(), Hotel.id.desc()]
+    else:
+        ordering = [sort_column, Hotel.id]
+    query = query.order_by(*ordering)
+    if skip:
+        query = query.offset(skip)
+    ids = [row.id for row in query.limit(limit).all()]
+    if not ids:
+        return []
+    
+    # Phase 2: load just those rows by primary key, keeping the index order
+    query = db.query(Hotel).filter(Hotel.id.in_(ids))
+    if fields is not None:
+        # The sort key is needed for the next-page cursor
+        query = query.options(_only_columns(Hotel, [*fields, sort]))
+    hotels = {hotel.id: hotel for hotel in query}
+    return [hotels[hotel_id] for hotel_id in ids]
+
+def get_hotel_amenities(db: Session, hotel_id: int) -> List[str]:
+    """Get the amenity names of a hotel"""
+    rows = db.query(HotelAmenity.amenity).filter(HotelAmenity.hotel_id == hotel_id).order_by(HotelAmenity.amenity).all()
+    return [row.amenity for row in rows]
+
+def get_hotel(db: Session, hotel_id: int, fields: Optional[Sequence[str]] = None) -> Optional[Hotel]:
+    """Get a specific hotel by ID (reading only the columns behind `fields`, if given)"""
+    query = db.query(Hotel).filter(Hotel.id == hotel_id)
+    if fields is not None:
+        query = query.options(_only_columns(Hotel, fields))
+    return query.first()
 
 def create_hotel(db: Session, name: str, location: str, description: str = "") -> Hotel:
     """Create a new hotel"""
@@ -28,75 +178,231 @@ def create_review(
     reviewer_name: str,
     review_text: str,
     sentiment_label: str,
-    sentiment_score: float
+    sentiment_score: Optional[float],
+    sentiment_model: Optional[str] = None,
+    signature: Optional[Any] = None,
+    duplicate_of: Optional[int] = None,
+    sentiment_status: str = "DONE"
 ) -> Review:
-    """Create a new review"""
+    """
+    Create a new review
+    
+    `signature` is the review's MinHash signature (see dedup.py). Originals are added to the
+    LSH index; near-duplicates (`duplicate_of` set) are stored but not counted in the aggregates.
+    Reviews stored with sentiment_status "PENDING" are scored later by the ingestion worker.
+    """
     db_review = Review(
         hotel_id=hotel_id,
         reviewer_name=reviewer_name,
         review_text=review_text,
         sentiment_label=sentiment_label,
-        sentiment_score=sentiment_score
+        sentiment_score=sentiment_score,
+        sentiment_model=sentiment_model,
+        minhash=dedup.to_bytes(signature) if signature is not None else None,
+        duplicate_of=duplicate_of,
+        sentiment_status=sentiment_status
     )
     db.add(db_review)
     
+    if signature is not None and duplicate_of is None:
+        db.flush()
+        dedup.index_review(db, db_review.id, signature)
+    
     # Update hotel's average sentiment and review count
-    hotel = get_hotel(db, hotel_id)
+    hotel = get_hotel(db, hotel_id) if duplicate_of is None and sentiment_status == "DONE" else None
     if hotel:
         # Calculate new average sentiment
         total_score = hotel.average_sentiment * hotel.total_reviews
         total_score += sentiment_score
         hotel.total_reviews += 1
         hotel.average_sentiment = total_score / hotel.total_reviews
-        
-        db.commit()
-        db.refresh(db_review)
+    
+    db.commit()
+    db.refresh(db_review)
     
     return db_review
 
-def get_hotel_reviews(db: Session, hotel_id: int) -> List[Review]:
-    """Get all reviews for a specific hotel"""
-    return db.query(Review).filter(Review.hotel_id == hotel_id).all()
+def get_review(db: Session, review_id: int) -> Optional[Review]:
+    """Get a specific review by ID"""
+    return db.query(Review).filter(Review.id == review_id).first()
+
+def get_hotels_by_ids(db: Session, hotel_ids: List[int]) -> Dict[int, Hotel]:
+    """Hotels keyed by id (missing ids are left out)"""
+    if not hotel_ids:
+        return {}
+    return {hotel.id: hotel for hotel in db.query(Hotel).filter(Hotel.id.in_(hotel_ids))}
+
+def get_reviews_by_ids(db: Session, review_ids: List[int]) -> Dict[int, Review]:
+    """Reviews keyed by id (missing ids are left out)"""
+    if not review_ids:
+        return {}
+    return {review.id: review for review in db.query(Review).filter(Review.id.in_(review_ids))}
+
+def get_hotel_reviews(
+    db: Session,
+    hotel_id: int,
+    include_duplicates: bool = True,
+    fields: Optional[Sequence[str]] = None
+) -> List[Review]:
+    """Get all reviews for a specific hotel (reading only the columns behind `fields`, if given)"""
+    query = db.query(Review).filter(Review.hotel_id == hotel_id)
+    if not include_duplicates:
+        query = query.filter(Review.duplicate_of.is_(None))
+    if fields is not None:
+        query = query.options(_only_columns(Review, fields))
+    return query.all()
+
+def get_review_texts_by_hotel(db: Session, hotel_ids: List[int]) -> Dict[int, List[str]]:
+    """Review texts (near-duplicates excluded) of several hotels in one query, projecting only the text column"""
+    texts: Dict[int, List[str]] = {hotel_id: [] for hotel_id in hotel_ids}
+    rows = db.query(Review.hotel_id, Review.review_text).filter(
+        Review.hotel_id.in_(hotel_ids),
+        Review.review_text.isnot(None),
+        Review.duplicate_of.is_(None)
+    ).order_by(Review.hotel_id, Review.id)
+    for hotel_id, review_text in rows:
+        texts[hotel_id].append(review_text)
+    return texts
+
+def get_sentiment_counts_by_hotel(db: Session, hotel_ids: List[int]) -> Dict[int, Dict[str, int]]:
+    """Review counts per sentiment label for several hotels"""
+    counts: Dict[int, Dict[str, int]] = {hotel_id: {} for hotel_id in hotel_ids}
+    rows = db.query(Review.hotel_id, Review.sentiment_label, func.count(Review.id)).filter(
+        Review.hotel_id.in_(hotel_ids),
+        counted_reviews()
+    ).group_by(Review.hotel_id, Review.sentiment_label)
+    for hotel_id, label, count in rows:
+        counts[hotel_id][label or "NEUTRAL"] = count
+    return counts
 
 def get_hotel_by_name(db: Session, hotel_name: str) -> Optional[Hotel]:
     """Get a hotel by name (case-insensitive)"""
     return db.query(Hotel).filter(Hotel.name.ilike(f"%{hotel_name}%")).first()
 
+def create_summary_job(
+    db: Session,
+    job_key: str,
+    kind: str,
+    hotel_id: Optional[int] = None,
+    max_length: int = 100,
+    min_length: int = 20
+) -> SummaryJob:
+    """Create a pending summarization job"""
+    db_job = SummaryJob(
+        job_key=job_key,
+        kind=kind,
+        hotel_id=hotel_id,
+        max_length=max_length,
+        min_length=min_length,
+        status="PENDING"
+    )
+    db.add(db_job)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_summary_job(db: Session, job_id: int) -> Optional[SummaryJob]:
+    """Get a summarization job by ID"""
+    return db.query(SummaryJob).filter(SummaryJob.id == job_id).first()
+
+def get_active_summary_job(db: Session, job_key: str) -> Optional[SummaryJob]:
+    """Get a pending or running job with the same key, if any"""
+    return db.query(SummaryJob).filter(
+        SummaryJob.job_key == job_key,
+        SummaryJob.status.in_(("PENDING", "RUNNING"))
+    ).order_by(SummaryJob.id).first()
+
+def claim_summary_job(db: Session, job_id: int) -> bool:
+    """Atomically move a PENDING job to RUNNING; False when another worker got it first"""
+    now = datetime.utcnow()
+    result = db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.id == job_id, SummaryJob.status == "PENDING")
+        .values(status="RUNNING", started_at=now, heartbeat_at=now)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def heartbeat_summary_jobs(db: Session, job_ids: List[int]):
+    """Mark running jobs as still alive"""
+    if not job_ids:
+        return
+    db.execute(
+        update(SummaryJob)
+        .where(SummaryJob.id.in_(job_ids), SummaryJob.status == "RUNNING")
+        .values(heartbeat_at=datetime.utcnow())
+    )
+    db.commit()
+
+def recover_stale_summary_jobs(db: Session, expired_before: datetime) -> int:
+    """Return RUNNING jobs whose heartbeat stopped before `expired_before` to PENDING"""
+    result = db.execute(
+        update(SummaryJob)
+        .where(
+            SummaryJob.status == "RUNNING",
+            func.coalesce(SummaryJob.heartbeat_at, SummaryJob.started_at, SummaryJob.created_at) < expired_before
+        )
+        .values(status="PENDING", heartbeat_at=None)
+    )
+    db.commit()
+    return result.rowcount
+
+def get_pending_summary_job_ids(db: Session, limit: int) -> List[int]:
+    """Ids of the oldest pending jobs"""
+    rows = db.query(SummaryJob.id).filter(SummaryJob.status == "PENDING").order_by(SummaryJob.id).limit(limit)
+    return [row.id for row in rows]
+
+def update_summary_job(
+    db: Session,
+    job: SummaryJob,
+    status: str,
+    result: Optional[str] = None,
+    error: Optional[str] = None
+) -> SummaryJob:
+    """Move a job to a new status, recording its result or error"""
+    job.status = status
+    if status == "RUNNING":
+        job.started_at = datetime.utcnow()
+    elif status in ("DONE", "FAILED"):
+        job.finished_at = datetime.utcnow()
+    if result is not None:
+        job.result = result
+    if error is not None:
+        job.error = error
+    db.commit()
+    return job
+
+def recompute_hotel_aggregates(db: Session, hotel_ids: Optional[Iterable[int]] = None):
+    """Recompute review counts and average sentiment from the reviews table in one pass (see counted_reviews)"""
+    query = db.query(
+        Review.hotel_id,
+        func.count(Review.id),
+        func.avg(Review.sentiment_score)
+    ).filter(counted_reviews()).group_by(Review.hotel_id)
+    if hotel_ids is not None:
+        hotel_ids = list(hotel_ids)
+        query = query.filter(Review.hotel_id.in_(hotel_ids))
+    
+    stats: Dict[int, Dict] = {
+        hotel_id: {"id": hotel_id, "total_reviews": count, "average_sentiment": average or 0.0}
+        for hotel_id, count, average in query.all()
+    }
+    # Hotels whose reviews are all gone go back to zero
+    for hotel_id in hotel_ids or []:
+        stats.setdefault(hotel_id, {"id": hotel_id, "total_reviews": 0, "average_sentiment": 0.0})
+    
+    if stats:
+        db.execute(update(Hotel), list(stats.values()))
+    db.commit()
+
 def seed_sample_hotels(db: Session):
     """Seed database with sample hotels if empty"""
     if db.query(Hotel).first():
         return  # Already seeded
     
-    sample_hotels = [
-        {
-            "name": "Grand Plaza Hotel",
-            "location": "New York, NY",
-            "description": "Luxury hotel in the heart of Manhattan with stunning city views."
-        },
-        {
-            "name": "Ocean Breeze Resort",
-            "location": "Miami, FL", 
-            "description": "Beachfront resort with world-class amenities and spa services."
-        },
-        {
-            "name": "Mountain View Lodge",
-            "location": "Aspen, CO",
-            "description": "Cozy mountain lodge perfect for skiing and outdoor adventures."
-        },
-        {
-            "name": "Downtown Business Hotel",
-            "location": "Chicago, IL",
-            "description": "Modern business hotel with conference facilities and fine dining."
-        },
-        {
-            "name": "Historic Boutique Inn",
-            "location": "Charleston, SC",
-            "description": "Charming historic inn with southern hospitality and antique furnishings."
-        }
-    ]
-    
-    for hotel_data in sample_hotels:
-        create_hotel(db, **hotel_data)
+    # Load the sample catalog (data/hotels.json) in batched upserts
+    load_catalog(db=db)
+    hotel_ids = {hotel.external_id: hotel.id for hotel in db.query(Hotel.external_id, Hotel.id)}
     
     # Add sample reviews for testing summarization
     sample_reviews = [
@@ -147,5 +453,10 @@ def seed_sample_hotels(db: Session):
         }
     ]
     
-    for review_data in sample_reviews:
-        create_review(db, **review_data)
+    # Insert all sample reviews in one transaction, then compute aggregates once
+    db.add_all([
+        Review(**dict(review_data, hotel_id=hotel_ids[str(review_data["hotel_id"])]))
+        for review_data in sample_reviews
+    ])
+    db.commit()
+    recompute_hotel_aggregates(db)
@@ -0,0 +1,264 @@
+"""
+Opt-in per-request profiling and slow-query logging
+A request is profiled when it carries the profiling header set to PROFILE_TOKEN or is picked by
+the sampling rate. The same header guards the /profiles endpoints, which are off while no token
+is configured. Slow queries are logged with their parameter types only, never the values.
+"""
+
+import functools
+import hmac
+import inspect
+import logging
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("slow_query")
+
+# Configuration
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Secret the profiling header must carry; empty disables header profiling and /profiles
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_STORE_SIZE = int(os.getenv("PROFILE_STORE_SIZE", "200"))
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class RequestProfile:
+    """Wall-clock breakdown of a single request"""
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.total = 0.0
+        self.phases: Dict[str, float] = {}
+        self.queries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add_phase(self, name: str, elapsed: float):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    def add_query(self, statement: str, elapsed: float):
+        with self._lock:
+            self.queries.append({"statement": statement, "duration_ms": round(elapsed * 1000, 3)})
+            self.phases["db"] = self.phases.get("db", 0.0) + elapsed
+
+    def repeated_queries(self) -> List[Dict[str, Any]]:
+        """Statements executed often enough in one request to look like an N+1 pattern"""
+        counts: Dict[str, int] = {}
+        for query in self.queries:
+            key = _WHITESPACE.sub(" ", query["statement"]).strip()
+            counts[key] = counts.get(key, 0) + 1
+        return [
+            {"statement": statement, "count": count}
+            for statement, count in counts.items()
+            if count >= N_PLUS_ONE_THRESHOLD
+        ]
+
+    def to_dict(self) -> Dict[str, Any]:
+        phases_ms = {name: round(value * 1000, 3) for name, value in self.phases.items()}
+        accounted = sum(value for name, value in self.phases.items() if name in _TOP_LEVEL_PHASES)
+        phases_ms["other"] = round(max(self.total - accounted, 0.0) * 1000, 3)
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "total_ms": round(self.total * 1000, 3),
+            "phases_ms": phases_ms,
+            "query_count": len(self.queries),
+            "queries": self.queries,
+            "n_plus_one": self.repeated_queries(),
+        }
+
+    def server_timing(self) -> str:
+        """Render the breakdown as a Server-Timing header value"""
+        parts = [f"{name};dur={value * 1000:.2f}" for name, value in self.phases.items()]
+        parts.append(f"total;dur={self.total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+# Phases that do not overlap each other; the remainder of the request is reported as "other".
+# The endpoint phase already contains db and model time, so it is reported but not summed.
+_TOP_LEVEL_PHASES = {"endpoint", "serialization"}
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+class profile_phase:
+    """Context manager adding elapsed time to a phase of the active profile (no-op otherwise)"""
+
+    __slots__ = ("name", "_profile", "_start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._profile = _current_profile.get()
+        if self._profile is not None:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if self._profile is not None:
+            self._profile.add_phase(self.name, time.perf_counter() - self._start)
+        return False
+
+
+class ProfileStore:
+    """Bounded in-memory store of recent profiles"""
+
+    def __init__(self, maxsize: int = PROFILE_STORE_SIZE):
+        self.maxsize = maxsize
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: RequestProfile):
+        with self._lock:
+            self._profiles[profile.id] = profile.to_dict()
+            while len(self._profiles) > self.maxsize:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(profile_id)
+
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        with self._lock:
+            profiles = list(self._profiles.values())
+        return list(reversed(profiles[-limit:]))
+
+
+# Global store
+profile_store = ProfileStore()
+
+
+def authorized(headers) -> bool:
+    """Whether the request carries the profiling token (never true while none is configured)"""
+    return bool(PROFILE_TOKEN) and hmac.compare_digest(
+        headers.get(PROFILE_HEADER, "").encode("utf-8"), PROFILE_TOKEN.encode("utf-8")
+    )
+
+
+def should_profile(headers) -> bool:
+    """Decide whether to profile a request from its headers and the sampling rate"""
+    if authorized(headers):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile(method: str, path: str) -> Tuple[RequestProfile, object]:
+    profile = RequestProfile(method, path)
+    return profile, _current_profile.set(profile)
+
+
+def finish_profile(profile: RequestProfile, token: object, total: float):
+    _current_profile.reset(token)
+    profile.total = total
+    profile_store.add(profile)
+    n_plus_one = profile.repeated_queries()
+    if n_plus_one:
+        logger.warning(
+            f"Possible N+1 queries in {profile.method} {profile.path} (profile {profile.id}): "
+            + "; ".join(f"{item['count']}x {item['statement'][:120]}" for item in n_plus_one)
+        )
+    logger.info(f"Profiled {profile.method} {profile.path} in {total * 1000:.1f}ms (profile {profile.id})")
+
+
+class ProfiledRoute(APIRoute):
+    """Route class separating endpoint time from request validation and response serialization"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _wrap_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        @functools.wraps(handler)
+        async def profiled_handler(request):
+            profile = _current_profile.get()
+            if profile is None:
+                return await handler(request)
+            start = time.perf_counter()
+            endpoint_before = profile.phases.get("endpoint", 0.0)
+            response = await handler(request)
+            handler_time = time.perf_counter() - start
+            endpoint_time = profile.phases.get("endpoint", 0.0) - endpoint_before
+            profile.add_phase("serialization", max(handler_time - endpoint_time, 0.0))
+            return response
+
+        return profiled_handler
+
+
+def _wrap_endpoint(endpoint):
+    """Time the endpoint body; the wrapper keeps the signature FastAPI inspects"""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def async_wrapper(*args, **kwargs):
+            with profile_phase("endpoint"):
+                return await endpoint(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(endpoint)
+    def sync_wrapper(*args, **kwargs):
+        with profile_phase("endpoint"):
+            return endpoint(*args, **kwargs)
+    return sync_wrapper
+
+
+def instrument_pipeline(pipe):
+    """Split a transformers pipeline call into tokenization, forward and postprocess phases"""
+    for method_name, phase in (("preprocess", "tokenization"), ("_forward", "forward"),
+                               ("postprocess", "postprocess")):
+        original = getattr(pipe, method_name, None)
+        if original is None:
+            continue
+
+        def make_wrapper(func, phase_name):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with profile_phase(phase_name):
+                    return func(*args, **kwargs)
+            return wrapper
+
+        setattr(pipe, method_name, make_wrapper(original, phase))
+    return pipe
+
+
+def _describe_parameters(parameters) -> str:
+    """Parameter types, never values: bound values hold review text and reviewer names"""
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (list, tuple, dict)):
+        return f"{len(parameters)} rows of {_describe_parameters(parameters[0])}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in parameters or ()) + ")"
+
+
+def record_query(statement: str, parameters, elapsed: float):
+    """Query observer for metrics.instrument_engine: per-profile capture and the slow-query log"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_query(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        slow_query_logger.warning(
+            f"Slow query ({elapsed * 1000:.1f}ms): {_WHITESPACE.sub(' ', statement).strip()} "
+            f"params={_describe_parameters(parameters)}"
+        )
@@ -0,0 +1,189 @@
+"""
+Batch re-scoring of stored reviews
+Re-runs sentiment analysis over reviews whose scores came from a different (or unknown) model
+version. Reviews are walked in id order; each chunk is scored in one batched call and written
+back together with the checkpoint, so an interrupted run resumes where it stopped.
+
+Usage:
+    python rescoring.py run [chunk_size]
+    python rescoring.py status
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from sqlalchemy import and_, bindparam, or_, select, update
+
+from database import SessionLocal, Review, RescoreJob
+from lexicon import LEXICON_VERSION
+from model_registry import model_version
+from sentiment import SENTIMENT_CASCADE, sentiment_analyzer
+import models
+
+logger = logging.getLogger(__name__)
+
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "512"))
+RESCORE_BATCH_SIZE = int(os.getenv("RESCORE_BATCH_SIZE", "64"))
+
+
+def _is_stale(target_model: str):
+    """Filter for reviews whose score did not come from the current model"""
+    # Scores the lexicon cascade produced on purpose are current as well
+    current = [target_model, LEXICON_VERSION] if SENTIMENT_CASCADE else [target_model]
+    return and_(
+        # Write-behind reviews not scored yet belong to the ingestion worker
+        or_(Review.sentiment_status.is_(None), Review.sentiment_status == "DONE"),
+        or_(Review.sentiment_model.is_(None), Review.sentiment_model.notin_(current))
+    )
+
+
+def _get_or_create_job(db, target_model: str) -> RescoreJob:
+    """Resume the unfinished job for this model version, or start a new one"""
+    job = db.query(RescoreJob).filter(
+        RescoreJob.target_model == target_model,
+        RescoreJob.status == "RUNNING"
+    ).order_by(RescoreJob.id.desc()).first()
+    if job is None:
+        job = RescoreJob(target_model=target_model, status="RUNNING", last_review_id=0, processed=0)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+    else:
+        logger.info(f"Resuming re-scoring job {job.id} after review {job.last_review_id}")
+    return job
+
+
+def rescore_reviews(chunk_size: int = RESCORE_CHUNK_SIZE, batch_size: int = RESCORE_BATCH_SIZE,
+                    target_model: Optional[str] = None) -> Dict[str, Any]:
+    """Re-score every review not produced by the current sentiment model; returns a run report"""
+    target_model = target_model or model_version("sentiment")
+    db = SessionLocal()
+    try:
+        job = _get_or_create_job(db, target_model)
+        run_processed = 0
+        run_start = time.perf_counter()
+        update_stmt = (
+            update(Review.__table__)
+            .where(Review.__table__.c.id == bindparam("b_id"))
+            .values(
+                sentiment_label=bindparam("b_label"),
+                sentiment_score=bindparam("b_score"),
+                sentiment_model=bindparam("b_model")
+            )
+        )
+
+        while True:
+            chunk_start = time.perf_counter()
+            # Keyset walk: only the text column, only reviews not yet on the target model
+            rows = db.execute(
+                select(Review.id, Review.review_text)
+                .where(
+                    Review.id > job.last_review_id,
+                    _is_stale(target_model)
+                )
+                .order_by(Review.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            results = sentiment_analyzer.analyze_sentiment_batch(
+                [row.review_text or "" for row in rows], batch_size=batch_size
+            )
+            failed = next((result for result in results if "error" in result), None)
+            if failed is not None:
+                # Never overwrite real scores with placeholder results
+                raise RuntimeError(f"Sentiment analysis failed, job {job.id} stopped: {failed['error']}")
+
+            db.connection().execute(update_stmt, [
+                {
+                    "b_id": row.id,
+                    "b_label": result["label"],
+                    "b_score": result["score"],
+                    "b_model": result.get("model_version", target_model),
+                }
+                for row, result in zip(rows, results)
+            ])
+
+            # Checkpoint in the same transaction as the updates it covers
+            run_processed += len(rows)
+            job.last_review_id = rows[-1].id
+            job.processed += len(rows)
+            job.elapsed_seconds = (job.elapsed_seconds or 0.0) + time.perf_counter() - chunk_start
+            job.updated_at = datetime.utcnow()
+            db.commit()
+
+            elapsed = time.perf_counter() - run_start
+            logger.info(
+                f"Re-scored {job.processed} reviews (up to id {job.last_review_id}), "
+                f"{run_processed / elapsed:.1f} reviews/s"
+            )
+
+        # Aggregates once at the end, not per review
+        models.recompute_hotel_aggregates(db)
+
+        elapsed = time.perf_counter() - run_start
+        job.status = "DONE"
+        job.finished_at = datetime.utcnow()
+        db.commit()
+
+        return {
+            "job_id": job.id,
+            "target_model": target_model,
+            "processed_this_run": run_processed,
+            "processed_total": job.processed,
+            "elapsed_seconds": round(elapsed, 2),
+            "reviews_per_second": round(run_processed / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+    finally:
+        db.close()
+
+
+def rescore_status() -> Dict[str, Any]:
+    """Progress of the latest job and how many reviews are still on another model version"""
+    target_model = model_version("sentiment")
+    db = SessionLocal()
+    try:
+        job = db.query(RescoreJob).order_by(RescoreJob.id.desc()).first()
+        stale = db.query(Review.id).filter(_is_stale(target_model)).count()
+        return {
+            "target_model": target_model,
+            "stale_reviews": stale,
+            "latest_job": None if job is None else {
+                "id": job.id,
+                "target_model": job.target_model,
+                "status": job.status,
+                "last_review_id": job.last_review_id,
+                "processed": job.processed,
+            },
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if command == "run":
+        size = int(sys.argv[2]) if len(sys.argv) > 2 else RESCORE_CHUNK_SIZE
+        report = rescore_reviews(chunk_size=size)
+        print(
+            f"✅ Re-scored {report['processed_this_run']} reviews with {report['target_model']} "
+            f"in {report['elapsed_seconds']}s ({report['reviews_per_second']} reviews/s)"
+        )
+    elif command == "status":
+        status = rescore_status()
+        print(f"Target model: {status['target_model']}")
+        print(f"Reviews on another model version: {status['stale_reviews']}")
+        if status["latest_job"]:
+            print(f"Latest job: {status['latest_job']}")
+    else:
+        print("Available commands:")
+        print("  python rescoring.py run [chunk_size]  - Re-score reviews not produced by the current model")
+        print("  python rescoring.py status            - Show re-scoring progress")
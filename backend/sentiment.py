@@ -1,26 +1,93 @@
+# Before transformers: applies MODEL_OFFLINE to the hub flags transformers reads at import
+from model_registry import model_source, model_version
 from transformers import pipeline
-from typing import Dict, Any
+from typing import Callable, Dict, Any, List
 import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import lexicon
+import metrics
+from profiling import instrument_pipeline
+from metrics import track_inference
+from model_server import use_model_server, RemoteModelProxy
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Lexicon fast path in front of the transformer (see lexicon.py)
+SENTIMENT_CASCADE = os.getenv("SENTIMENT_CASCADE", "false").lower() == "true"
+# Share of short-circuited texts also sent to the transformer to measure agreement
+SENTIMENT_CASCADE_SHADOW_RATE = float(os.getenv("SENTIMENT_CASCADE_SHADOW_RATE", "0.02"))
+# Shadow texts waiting for the transformer; further samples are dropped while this many are queued
+SENTIMENT_CASCADE_SHADOW_BACKLOG = int(os.getenv("SENTIMENT_CASCADE_SHADOW_BACKLOG", "256"))
+
+cascade_texts = metrics.registry.counter(
+    "sentiment_cascade_texts_total", "Texts scored by each cascade stage", ("path",)
+)
+cascade_agreement = metrics.registry.counter(
+    "sentiment_cascade_agreement_total",
+    "Lexicon vs transformer label comparisons (path=lexicon: shadow-sampled short circuits)",
+    ("path", "agreed")
+)
+
 class SentimentAnalyzer:
     def __init__(self):
         """Initialize the sentiment analysis pipeline"""
+        # Stored with every score so results from different models are never mixed up
+        self.model_version = model_version("sentiment")
         try:
             # Use DistilBERT model fine-tuned for sentiment analysis
+            # (from the local model registry when it has been prepared)
             self.classifier = pipeline(
                 "sentiment-analysis",
-                model="distilbert-base-uncased-finetuned-sst-2-english",
+                model=model_source("sentiment"),
                 return_all_scores=True
             )
+            instrument_pipeline(self.classifier)
             logger.info("Sentiment analysis model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading sentiment model: {e}")
             self.classifier = None
     
+    def _to_result(self, scores: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Convert the per-label model scores of one text into our result format"""
+        if not scores:
+            return {
+                "label": "NEUTRAL",
+                "score": 0.5,
+                "confidence": 0.0
+            }
+        
+        # Get the highest scoring sentiment
+        best_result = max(scores, key=lambda x: x['score'])
+        
+        # Map model labels to our labels
+        label_mapping = {
+            "POSITIVE": "POSITIVE",
+            "NEGATIVE": "NEGATIVE"
+        }
+        
+        sentiment_label = label_mapping.get(best_result['label'], "NEUTRAL")
+        confidence = best_result['score']
+        
+        # Convert to our scoring system (0-1 scale where 0.5 is neutral)
+        if sentiment_label == "POSITIVE":
+            score = 0.5 + (confidence * 0.5)  # 0.5 to 1.0
+        elif sentiment_label == "NEGATIVE":
+            score = 0.5 - (confidence * 0.5)  # 0.0 to 0.5
+        else:
+            score = 0.5  # Neutral
+        
+        return {
+            "label": sentiment_label,
+            "score": round(score, 3),
+            "confidence": round(confidence, 3),
+            "model_version": self.model_version
+        }
+    
     def analyze_sentiment(self, text: str) -> Dict[str, Any]:
         """
         Analyze sentiment of given text
@@ -41,36 +108,13 @@ class SentimentAnalyzer:
         
         try:
             # Get prediction
-            results = self.classifier(text)
+            with track_inference("sentiment"):
+                results = self.classifier(text)
             
             # Process results
             if results and len(results[0]) > 0:
-                # Get the highest scoring sentiment
-                best_result = max(results[0], key=lambda x: x['score'])
-                
-                # Map model labels to our labels
-                label_mapping = {
-                    "POSITIVE": "POSITIVE",
-                    "NEGATIVE": "NEGATIVE"
-                }
-                
-                sentiment_label = label_mapping.get(best_result['label'], "NEUTRAL")
-                confidence = best_result['score']
-                
-                # Convert to our scoring system (0-1 scale where 0.5 is neutral)
-                if sentiment_label == "POSITIVE":
-                    score = 0.5 + (confidence * 0.5)  # 0.5 to 1.0
-                elif sentiment_label == "NEGATIVE":
-                    score = 0.5 - (confidence * 0.5)  # 0.0 to 0.5
-                else:
-                    score = 0.5  # Neutral
-                
-                return {
-                    "label": sentiment_label,
-                    "score": round(score, 3),
-                    "confidence": round(confidence, 3)
-                }
-            
+                return self._to_result(results[0])
+        
         except Exception as e:
             logger.error(f"Error analyzing sentiment: {e}")
             return {
@@ -85,6 +129,130 @@ class SentimentAnalyzer:
             "score": 0.5,
             "confidence": 0.0
         }
+    
+    def analyze_sentiment_batch(self, texts: List[str], batch_size: int = 32) -> List[Dict[str, Any]]:
+        """
+        Analyze sentiment of several texts in batched forward passes
+        
+        Args:
+            texts (List[str]): Texts to analyze
+            batch_size (int): Number of texts per forward pass
+            
+        Returns:
+            One result dict per input text, in the same order
+        """
+        if not texts:
+            return []
+        
+        if not self.classifier:
+            return [
+                {"label": "NEUTRAL", "score": 0.5, "confidence": 0.0, "error": "Model not loaded"}
+                for _ in texts
+            ]
+        
+        try:
+            with track_inference("sentiment", batch_size=len(texts)):
+                results = self.classifier(list(texts), batch_size=batch_size, truncation=True)
+            return [self._to_result(scores) for scores in results]
+        except Exception as e:
+            logger.error(f"Error analyzing sentiment batch: {e}")
+            return [
+                {"label": "NEUTRAL", "score": 0.5, "confidence": 0.0, "error": str(e)}
+                for _ in texts
+            ]
+
+class SentimentCascade:
+    """
+    Scores texts with the lexicon first and sends only those below the confidence threshold
+    to the transformer analyzer it wraps
+    """
+    
+    def __init__(self, analyzer, threshold: float = None, shadow_rate: float = SENTIMENT_CASCADE_SHADOW_RATE,
+                 shadow_backlog: int = SENTIMENT_CASCADE_SHADOW_BACKLOG):
+        self.analyzer = analyzer
+        self.threshold = threshold if threshold is not None else lexicon.cascade_threshold()
+        self.shadow_rate = shadow_rate
+        self.shadow_backlog = shadow_backlog
+        # Shadow comparisons only feed metrics, so they run off the request path
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sentiment-shadow")
+        self._shadow_pending = 0
+        self._shadow_lock = threading.Lock()
+        logger.info(f"Sentiment cascade enabled (threshold {self.threshold:.4f})")
+    
+    def __getattr__(self, name: str):
+        return getattr(self.analyzer, name)
+    
+    def _cascade(self, texts: List[str], transformer: Callable[[List[str]], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        estimates = lexicon.score_batch(texts)
+        results: List[Any] = [None] * len(texts)
+        escalated, shadowed = [], []
+        for i, estimate in enumerate(estimates):
+            if estimate.confidence >= self.threshold:
+                results[i] = estimate.to_result()
+                if random.random() < self.shadow_rate:
+                    shadowed.append(i)
+            else:
+                escalated.append(i)
+        
+        cascade_texts.inc(len(texts) - len(escalated), path="lexicon")
+        cascade_texts.inc(len(escalated), path="transformer")
+        
+        if shadowed:
+            self._submit_shadow([texts[i] for i in shadowed], [estimates[i] for i in shadowed])
+        if not escalated:
+            return results
+        model_results = transformer([texts[i] for i in escalated])
+        for i, model_result in zip(escalated, model_results):
+            results[i] = model_result
+            self._record_agreement("transformer", estimates[i], model_result)
+        return results
+    
+    @staticmethod
+    def _record_agreement(path: str, estimate, model_result: Dict[str, Any]):
+        if "error" not in model_result and estimate.label != "NEUTRAL":
+            agreed = estimate.label == model_result["label"]
+            cascade_agreement.inc(path=path, agreed=str(agreed).lower())
+    
+    def _submit_shadow(self, texts: List[str], estimates: list):
+        with self._shadow_lock:
+            if self._shadow_pending + len(texts) > self.shadow_backlog:
+                return  # The transformer is behind; skip this sample rather than queue without bound
+            self._shadow_pending += len(texts)
+        self._shadow_executor.submit(self._shadow, texts, estimates)
+    
+    def _shadow(self, texts: List[str], estimates: list):
+        """Score sampled short-circuited texts with the transformer to measure lexicon agreement"""
+        try:
+            for estimate, model_result in zip(estimates, self.analyzer.analyze_sentiment_batch(texts)):
+                self._record_agreement("lexicon", estimate, model_result)
+        except Exception as e:
+            logger.warning(f"Sentiment cascade shadow comparison failed: {e}")
+        finally:
+            with self._shadow_lock:
+                self._shadow_pending -= len(texts)
+    
+    def analyze_sentiment(self, text: str) -> Dict[str, Any]:
+        return self._cascade(
+            [text], lambda batch: [self.analyzer.analyze_sentiment(item) for item in batch]
+        )[0]
+    
+    def analyze_sentiment_batch(self, texts: List[str], batch_size: int = 32) -> List[Dict[str, Any]]:
+        if not texts:
+            return []
+        return self._cascade(
+            list(texts), lambda batch: self.analyzer.analyze_sentiment_batch(batch, batch_size=batch_size)
+        )
+
+# Global instances
+if use_model_server():
+    # Models live in the shared model server (loaded locally only with MODEL_SERVER_LOCAL_FALLBACK)
+    transformer_analyzer = RemoteModelProxy(
+        "sentiment",
+        SentimentAnalyzer,
+        remote_methods=("analyze_sentiment", "analyze_sentiment_batch")
+    )
+else:
+    transformer_analyzer = SentimentAnalyzer()
 
-# Global instance
-sentiment_analyzer = SentimentAnalyzer()
+# The cascade runs in the API process, so short-circuited texts never reach the model server
+sentiment_analyzer = SentimentCascade(transformer_analyzer) if SENTIMENT_CASCADE else transformer_analyzer
@@ -1,32 +1,110 @@
-from transformers import pipeline
-from typing import Dict, Any, List
+# Before transformers: applies MODEL_OFFLINE to the hub flags transformers reads at import
+from model_registry import MODEL_SPECS, model_source
+from transformers import pipeline, StoppingCriteria, StoppingCriteriaList
+from typing import Dict, Any, Iterator, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import contextvars
+import hashlib
 import logging
 import os
+import threading
+import time
+from profiling import instrument_pipeline
+from metrics import registry, track_inference, summaries_by_model
+from model_server import use_model_server, RemoteModelProxy
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Latency budget for /summarize when the request does not set one
+SUMMARIZE_DEADLINE_MS = int(os.getenv("SUMMARIZE_DEADLINE_MS", "3000"))
+# Let abandoned generations finish in the background to fill the summary cache
+SUMMARIZE_BACKGROUND_FILL = os.getenv("SUMMARIZE_BACKGROUND_FILL", "true").lower() == "true"
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "256"))
+# Hotels summarized per forward pass by summarize_reviews_batch
+SUMMARIZE_BATCH_SIZE = int(os.getenv("SUMMARIZE_BATCH_SIZE", "8"))
+
+summary_deadline_exceeded = registry.counter(
+    "summary_deadline_exceeded_total", "Summaries served by the extractive path because the deadline passed",
+    ("abstractive_status",)
+)
+summary_cache_hits = registry.counter(
+    "summary_cache_hits_total", "Summaries served from the in-memory summary cache"
+)
+
+class _StopOnEvent(StoppingCriteria):
+    """Stops generation at the next step once the event is set"""
+    
+    def __init__(self, stop_event: threading.Event):
+        self.stop_event = stop_event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return input_ids.new_full((input_ids.shape[0],), int(self.stop_event.is_set())).bool()
+
+class _Generation:
+    """An abstractive generation shared by every request waiting for the same summary"""
+    
+    def __init__(self, future: Future, stop_event: threading.Event):
+        self.future = future
+        self.stop_event = stop_event
+        self.waiters = 0
+
+class SummaryCache:
+    """Small LRU cache of abstractive summaries keyed by input text and length settings"""
+    
+    def __init__(self, maxsize: int = SUMMARY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key(text: str, max_length: int, min_length: int) -> str:
+        return hashlib.sha1(f"{max_length}:{min_length}:{text}".encode("utf-8")).hexdigest()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+    
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
 class ReviewSummarizer:
     def __init__(self):
         """Initialize the text summarization pipeline"""
         self.summarizer = None
         self.model_name = None
+        self.cache = SummaryCache()
+        # One generation at a time; more would only compete for the same cores
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+        self._generation_lock = threading.RLock()
+        self._waiting = 0  # Submitted to the executor but not started yet
+        self._in_flight: Dict[str, _Generation] = {}  # Deadline generations by cache key
         
-        # Set cache directory to avoid permission issues
-        os.environ['TRANSFORMERS_CACHE'] = '/tmp/transformers_cache'
+        # Set cache directory to avoid permission issues (only used when loading from the hub)
+        os.environ.setdefault('TRANSFORMERS_CACHE', '/tmp/transformers_cache')
         
         # Try to load the most efficient model for our use case
+        model_name = MODEL_SPECS["summarization"]["name"]
         try:
-            logger.info("Loading t5-small model for summarization")
+            logger.info(f"Loading {model_name} model for summarization")
             self.summarizer = pipeline(
                 "summarization",
-                model="t5-small",
+                model=model_source("summarization"),
                 device=-1,  # Force CPU usage for better compatibility
                 max_length=150,
             )
-            self.model_name = "t5-small"
-            logger.info("Successfully loaded t5-small model")
+            instrument_pipeline(self.summarizer)
+            self.model_name = model_name
+            logger.info(f"Successfully loaded {model_name} model")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
             logger.info("Using fallback extractive summarization")
@@ -93,6 +171,71 @@ class ReviewSummarizer:
         
         return combined_text
     
+    def _generate(self, combined_text: str, max_length: int, min_length: int,
+                  stop_event: Optional[threading.Event] = None) -> str:
+        """Run abstractive generation; setting stop_event ends it at the next decoding step"""
+        generate_kwargs = {}
+        if stop_event is not None:
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([_StopOnEvent(stop_event)])
+        
+        with track_inference("summarization"):
+            summary_result = self.summarizer(
+                combined_text,
+                max_length=max_length,
+                min_length=min_length,
+                do_sample=False,
+                clean_up_tokenization_spaces=True,
+                **generate_kwargs
+            )
+        
+        return summary_result[0]['summary_text'] if summary_result else "Unable to generate summary."
+    
+    def _generate_batch(self, texts: List[str], max_length: int, min_length: int, batch_size: int) -> List[str]:
+        """Run abstractive generation for several inputs in batched forward passes"""
+        # Similar lengths in the same batch keep padding (wasted decoder work) small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        with track_inference("summarization", batch_size=len(texts)):
+            outputs = self.summarizer(
+                [texts[i] for i in order],
+                batch_size=batch_size,
+                max_length=max_length,
+                min_length=min_length,
+                do_sample=False,
+                truncation=True,
+                clean_up_tokenization_spaces=True
+            )
+        
+        summaries: List[str] = [""] * len(texts)
+        for i, output in zip(order, outputs):
+            # Batched pipelines may wrap each result in a list
+            if isinstance(output, list):
+                output = output[0] if output else {}
+            summaries[i] = output.get("summary_text") or "Unable to generate summary."
+        return summaries
+    
+    def _generate_streaming(self, combined_text: str, max_length: int, min_length: int, streamer,
+                            stop_event: threading.Event):
+        """Run generation token by token into a streamer; setting stop_event cancels it"""
+        try:
+            model = self.summarizer.model
+            # Same task prefix the pipeline adds ("summarize: " for t5)
+            prefix = getattr(model.config, "prefix", None) or ""
+            inputs = self.summarizer.tokenizer(
+                prefix + combined_text, return_tensors="pt", truncation=True
+            ).to(model.device)
+            with track_inference("summarization"):
+                model.generate(
+                    **inputs,
+                    max_length=max_length,
+                    min_length=min_length,
+                    do_sample=False,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_StopOnEvent(stop_event)])
+                )
+        finally:
+            # Unblock the reader even if generation failed
+            streamer.end()
+    
     def summarize_reviews(self, reviews: List[str], max_length: int = 100, min_length: int = 20) -> Dict[str, Any]:
         """Summarize a list of reviews"""
         if not reviews:
@@ -123,15 +266,8 @@ class ReviewSummarizer:
                         "processed_reviews": 0
                     }
                 
-                summary_result = self.summarizer(
-                    combined_text,
-                    max_length=max_length,
-                    min_length=min_length,
-                    do_sample=False,
-                    clean_up_tokenization_spaces=True
-                )
-                
-                summary_text = summary_result[0]['summary_text'] if summary_result else "Unable to generate summary."
+                summary_text = self._submit(self._generate, combined_text, max_length, min_length).result()
+                summaries_by_model.inc(model_used=self.model_name)
                 
                 return {
                     "summary": summary_text,
@@ -143,6 +279,7 @@ class ReviewSummarizer:
             else:
                 # Use fallback extractive summarization
                 summary_text = self._extractive_summary(reviews, max_sentences=3)
+                summaries_by_model.inc(model_used="extractive_fallback")
                 
                 return {
                     "summary": summary_text,
@@ -157,6 +294,7 @@ class ReviewSummarizer:
             # Try fallback method
             try:
                 summary_text = self._extractive_summary(reviews, max_sentences=2)
+                summaries_by_model.inc(model_used="extractive_fallback")
                 return {
                     "summary": summary_text,
                     "total_reviews": len(reviews),
@@ -172,5 +310,348 @@ class ReviewSummarizer:
                     "processed_reviews": 0
                 }
 
+    def summarize_reviews_batch(
+        self,
+        review_lists: List[List[str]],
+        max_length: int = 100,
+        min_length: int = 20,
+        batch_size: int = SUMMARIZE_BATCH_SIZE
+    ) -> List[Dict[str, Any]]:
+        """
+        Summarize the reviews of several hotels at once
+        
+        Returns one result per review list, in the same format as summarize_reviews. Cached
+        summaries are reused and everything else is generated in batched calls on the generation
+        thread; the caller blocks until they finish, so async code should run this in a threadpool.
+        """
+        results: List[Any] = [None] * len(review_lists)
+        pending = []  # (index, combined text, cache key, processed count)
+        
+        for i, reviews in enumerate(review_lists):
+            combined_text = self._preprocess_reviews(reviews)
+            if not self.summarizer or len(combined_text.strip()) < 50:
+                # Nothing to generate: empty input, too little text or no model
+                results[i] = self.summarize_reviews(reviews, max_length=max_length, min_length=min_length)
+                continue
+            
+            processed_count = len([r for r in reviews if r and len(r.strip()) > 10])
+            cache_key = SummaryCache.key(combined_text, max_length, min_length)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                summary_cache_hits.inc()
+                summaries_by_model.inc(model_used=self.model_name)
+                results[i] = {
+                    "summary": cached,
+                    "total_reviews": len(reviews),
+                    "processed_reviews": processed_count,
+                    "input_length": len(combined_text),
+                    "model_used": self.model_name,
+                    "served_from_cache": True
+                }
+                continue
+            pending.append((i, combined_text, cache_key, processed_count))
+        
+        if not pending:
+            return results
+        
+        try:
+            # On the generation thread like every other generation, so only one runs at a time
+            summaries = self._submit(
+                self._generate_batch, [item[1] for item in pending], max_length, min_length, batch_size
+            ).result()
+        except Exception as e:
+            logger.error(f"Error generating batched summaries: {e}")
+            for i, _, _, processed_count in pending:
+                summaries_by_model.inc(model_used="extractive_fallback")
+                results[i] = {
+                    "summary": self._extractive_summary(review_lists[i], max_sentences=2),
+                    "total_reviews": len(review_lists[i]),
+                    "processed_reviews": processed_count,
+                    "error": f"AI summarization failed, used fallback: {str(e)}",
+                    "model_used": "extractive_fallback"
+                }
+            return results
+        
+        for (i, combined_text, cache_key, processed_count), summary_text in zip(pending, summaries):
+            self.cache.put(cache_key, summary_text)
+            summaries_by_model.inc(model_used=self.model_name)
+            results[i] = {
+                "summary": summary_text,
+                "total_reviews": len(review_lists[i]),
+                "processed_reviews": processed_count,
+                "input_length": len(combined_text),
+                "model_used": self.model_name
+            }
+        return results
+    
+    def stream_summary(
+        self,
+        reviews: List[str],
+        max_length: int = 100,
+        min_length: int = 20,
+        stop_event: Optional[threading.Event] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Summarize reviews incrementally
+        
+        Yields {"type": "delta", "text": ...} as text is generated, then one {"type": "done", ...}
+        event carrying the usual summarize_reviews result plus timings. Closing the iterator or
+        setting stop_event cancels the generation at the next decoding step.
+        """
+        from transformers import TextIteratorStreamer
+        
+        stop_event = stop_event or threading.Event()
+        start = time.perf_counter()
+        combined_text = self._preprocess_reviews(reviews)
+        
+        if not self.summarizer or len(combined_text.strip()) < 50:
+            # Nothing to stream: the plain path answers at once
+            result = self.summarize_reviews(reviews, max_length=max_length, min_length=min_length)
+            yield {"type": "delta", "text": result["summary"]}
+            result["timings_ms"] = {"total_ms": round((time.perf_counter() - start) * 1000, 1)}
+            yield dict(result, type="done")
+            return
+        
+        processed_count = len([r for r in reviews if r and len(r.strip()) > 10])
+        result = {
+            "total_reviews": len(reviews),
+            "processed_reviews": processed_count,
+            "input_length": len(combined_text),
+            "model_used": self.model_name
+        }
+        cache_key = SummaryCache.key(combined_text, max_length, min_length)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            summary_cache_hits.inc()
+            summaries_by_model.inc(model_used=self.model_name)
+            yield {"type": "delta", "text": cached}
+            yield dict(result, type="done", summary=cached, served_from_cache=True,
+                       timings_ms={"total_ms": round((time.perf_counter() - start) * 1000, 1)})
+            return
+        
+        streamer = TextIteratorStreamer(
+            self.summarizer.tokenizer, skip_prompt=True, skip_special_tokens=True,
+            clean_up_tokenization_spaces=True
+        )
+        future = self._submit(
+            self._generate_streaming, combined_text, max_length, min_length, streamer, stop_event
+        )
+        parts = []
+        first_token_ms = None
+        try:
+            for text in streamer:
+                if not text:
+                    continue
+                if first_token_ms is None:
+                    first_token_ms = round((time.perf_counter() - start) * 1000, 1)
+                parts.append(text)
+                yield {"type": "delta", "text": text}
+            future.result()
+            # Set by the caller (e.g. client disconnect) before generation finished on its own
+            stopped_early = stop_event.is_set()
+        except Exception as e:
+            logger.error(f"Error streaming summary: {e}")
+            summary_text = self._extractive_summary(reviews, max_sentences=2)
+            summaries_by_model.inc(model_used="extractive_fallback")
+            yield {"type": "delta", "text": summary_text}
+            yield dict(result, type="done", summary=summary_text, model_used="extractive_fallback",
+                       error=f"AI summarization failed, used fallback: {str(e)}",
+                       timings_ms={"total_ms": round((time.perf_counter() - start) * 1000, 1)})
+            return
+        finally:
+            # Reached on completion and when the consumer goes away mid-stream
+            stop_event.set()
+        
+        summary_text = "".join(parts).strip() or "Unable to generate summary."
+        if not stopped_early:
+            # A truncated summary must not be served to later requests
+            self.cache.put(cache_key, summary_text)
+        summaries_by_model.inc(model_used=self.model_name)
+        yield dict(result, type="done", summary=summary_text, timings_ms={
+            "first_token_ms": first_token_ms,
+            "total_ms": round((time.perf_counter() - start) * 1000, 1)
+        })
+    
+    def summarize_reviews_with_deadline(
+        self,
+        reviews: List[str],
+        max_length: int = 100,
+        min_length: int = 20,
+        deadline_ms: Optional[int] = None,
+        background_fill: bool = SUMMARIZE_BACKGROUND_FILL
+    ) -> Dict[str, Any]:
+        """
+        Summarize reviews within a latency budget
+        
+        The abstractive summary is used if it finishes before the deadline; otherwise the
+        extractive summary is returned and the generation is either cancelled or left to
+        finish in the background so the cache is warm for the next request. Identical requests
+        wait on the same generation, and none is started while others are queued for the model.
+        """
+        deadline_ms = deadline_ms if deadline_ms is not None else SUMMARIZE_DEADLINE_MS
+        combined_text = self._preprocess_reviews(reviews)
+        
+        # Nothing to generate, or no model: the plain path already answers quickly
+        if not self.summarizer or len(combined_text.strip()) < 50:
+            start = time.perf_counter()
+            result = self.summarize_reviews(reviews, max_length=max_length, min_length=min_length)
+            path = "extractive_ms" if result.get("model_used") == "extractive_fallback" else "total_ms"
+            result["timings_ms"] = {path: round((time.perf_counter() - start) * 1000, 1)}
+            return result
+        
+        processed_count = len([r for r in reviews if r and len(r.strip()) > 10])
+        cache_key = SummaryCache.key(combined_text, max_length, min_length)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            summary_cache_hits.inc()
+            summaries_by_model.inc(model_used=self.model_name)
+            return {
+                "summary": cached,
+                "total_reviews": len(reviews),
+                "processed_reviews": processed_count,
+                "input_length": len(combined_text),
+                "model_used": self.model_name,
+                "served_from_cache": True,
+                "timings_ms": {"abstractive_ms": 0.0}
+            }
+        
+        start = time.perf_counter()
+        generation = self._join_generation(cache_key, combined_text, max_length, min_length)
+        error = None
+        if generation is None:
+            # Requests are already queued for the model; this one would spend its budget waiting
+            abstractive_ms = 0.0
+            abstractive_status = "skipped"
+            summary_deadline_exceeded.inc(abstractive_status=abstractive_status)
+        else:
+            try:
+                summary_text = generation.future.result(timeout=max(deadline_ms, 0) / 1000.0)
+            except FutureTimeoutError:
+                abstractive_ms = round((time.perf_counter() - start) * 1000, 1)
+                abstractive_status = self._leave_generation(cache_key, generation, background_fill)
+                summary_deadline_exceeded.inc(abstractive_status=abstractive_status)
+            except Exception as e:
+                logger.error(f"Error generating summary: {e}")
+                self._leave_generation(cache_key, generation, background_fill=False)
+                abstractive_ms = round((time.perf_counter() - start) * 1000, 1)
+                abstractive_status = "failed"
+                error = f"AI summarization failed, used fallback: {str(e)}"
+            else:
+                self._leave_generation(cache_key, generation, background_fill=True)
+                summaries_by_model.inc(model_used=self.model_name)
+                return {
+                    "summary": summary_text,
+                    "total_reviews": len(reviews),
+                    "processed_reviews": processed_count,
+                    "input_length": len(combined_text),
+                    "model_used": self.model_name,
+                    "deadline_exceeded": False,
+                    "timings_ms": {"abstractive_ms": round((time.perf_counter() - start) * 1000, 1)}
+                }
+        
+        extractive_start = time.perf_counter()
+        summary_text = self._extractive_summary(reviews, max_sentences=3)
+        summaries_by_model.inc(model_used="extractive_fallback")
+        
+        result = {
+            "summary": summary_text,
+            "total_reviews": len(reviews),
+            "processed_reviews": processed_count,
+            "model_used": "extractive_fallback",
+            "deadline_exceeded": abstractive_status in ("background", "cancelled"),
+            "abstractive_status": abstractive_status,
+            "timings_ms": {
+                "abstractive_ms": abstractive_ms,
+                "extractive_ms": round((time.perf_counter() - extractive_start) * 1000, 1)
+            }
+        }
+        if error:
+            result["error"] = error
+        return result
+    
+    def _submit(self, fn, *args) -> Future:
+        """
+        Queue work for the generation thread, counting it as waiting until it starts
+        
+        The work runs in a copy of the caller's context, so tokenization and forward phases land
+        in the originating request's profile.
+        """
+        context = contextvars.copy_context()
+        
+        def run():
+            with self._generation_lock:
+                self._waiting -= 1
+            return context.run(fn, *args)
+        
+        def discard_cancelled(future: Future):
+            if future.cancelled():
+                with self._generation_lock:
+                    self._waiting -= 1
+        
+        with self._generation_lock:
+            self._waiting += 1
+            future = self._executor.submit(run)
+        future.add_done_callback(discard_cancelled)
+        return future
+    
+    def _join_generation(self, cache_key: str, combined_text: str, max_length: int,
+                         min_length: int) -> Optional[_Generation]:
+        """
+        Wait on the running generation for this summary, or start one
+        
+        Returns None when other work is already queued for the model: the request would spend
+        its whole budget in the queue while making the backlog longer.
+        """
+        with self._generation_lock:
+            generation = self._in_flight.get(cache_key)
+            if generation is None:
+                if self._waiting > 0:
+                    return None
+                stop_event = threading.Event()
+                generation = _Generation(
+                    self._submit(self._generate, combined_text, max_length, min_length, stop_event), stop_event
+                )
+                self._in_flight[cache_key] = generation
+                generation.future.add_done_callback(lambda done: self._fill_cache(cache_key, generation))
+            generation.waiters += 1
+            return generation
+    
+    def _leave_generation(self, cache_key: str, generation: _Generation, background_fill: bool) -> str:
+        """
+        Stop waiting for a generation; returns what happens to it ("background" or "cancelled")
+        
+        The last request to leave an unfinished generation lets it finish in the background only
+        if it is already running and nothing is queued behind it; otherwise it is stopped.
+        """
+        with self._generation_lock:
+            generation.waiters -= 1
+            if generation.waiters > 0 or generation.future.done():
+                return "background"
+            if background_fill and generation.future.running() and self._waiting == 0:
+                return "background"
+            generation.stop_event.set()
+            if self._in_flight.get(cache_key) is generation:
+                del self._in_flight[cache_key]
+        generation.future.cancel()
+        return "cancelled"
+    
+    def _fill_cache(self, cache_key: str, generation: _Generation):
+        """Cache a finished generation, unless it was stopped early and is truncated"""
+        future = generation.future
+        if not (future.cancelled() or generation.stop_event.is_set() or future.exception() is not None):
+            self.cache.put(cache_key, future.result())
+        # After the cache write, so a new request finds one or the other
+        with self._generation_lock:
+            if self._in_flight.get(cache_key) is generation:
+                del self._in_flight[cache_key]
+
 # Global instance
-review_summarizer = ReviewSummarizer()
+if use_model_server():
+    # Models live in the shared model server (loaded locally only with MODEL_SERVER_LOCAL_FALLBACK)
+    review_summarizer = RemoteModelProxy(
+        "summarization",
+        ReviewSummarizer,
+        remote_methods=("summarize_reviews", "summarize_reviews_batch", "summarize_reviews_with_deadline")
+    )
+else:
+    review_summarizer = ReviewSummarizer()
@@ -17,6 +17,8 @@ const SentimentBadge = ({ sentiment, score }) => {
       return `Positive (${(score * 100).toFixed(0)}%)`;
     } else if (sentiment === 'NEGATIVE') {
       return `Negative (${(score * 100).toFixed(0)}%)`;
+    } else if (sentiment === 'PENDING') {
+      return 'Scoring…';
     } else {
       return 'Neutral';
     }
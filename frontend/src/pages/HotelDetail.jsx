@@ -43,6 +43,9 @@ const HotelDetail = () => {
     const stats = { positive: 0, negative: 0, neutral: 0 };
     
     reviews.forEach(review => {
+      if (review.sentiment_score == null) {
+        return; // Not scored yet
+      }
       if (review.sentiment_score > 0.6) {
         stats.positive++;
       } else if (review.sentiment_score < 0.4) {
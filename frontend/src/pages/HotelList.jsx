@@ -13,7 +13,7 @@ const HotelList = () => {
 
   const fetchHotels = async () => {
     try {
-      const data = await hotelService.getAllHotels();
+      const data = await hotelService.getAllHotels('name,location,description,average_sentiment,total_reviews');
       setHotels(data);
     } catch (err) {
       setError('Failed to load hotels');
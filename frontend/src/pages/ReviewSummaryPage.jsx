@@ -13,7 +13,7 @@ const ReviewSummaryPage = () => {
 
   const fetchHotels = async () => {
     try {
-      const data = await hotelService.getAllHotels();
+      const data = await hotelService.getAllHotels('name,location,average_sentiment,total_reviews');
       setHotels(data.filter(hotel => hotel.total_reviews > 0));
     } catch (err) {
       console.error('Error fetching hotels:', err);
@@ -26,7 +26,9 @@ const ReviewSummaryPage = () => {
     setLoadingSummary(prev => ({ ...prev, [hotelId]: true }));
     
     try {
-      const result = await summarizationService.summarizeReviews(hotelId);
+      const result = await summarizationService.streamSummary(hotelId, {
+        onText: (text) => setSummaries(prev => ({ ...prev, [hotelId]: { summary: text, streaming: true } }))
+      });
       setSummaries(prev => ({ ...prev, [hotelId]: result }));
     } catch (err) {
       setSummaries(prev => ({ 
@@ -45,7 +47,6 @@ const ReviewSummaryPage = () => {
     for (const hotel of hotels) {
       if (!summaries[hotel.id] && !loadingSummary[hotel.id]) {
         await generateSummary(hotel.id);
-        await new Promise(resolve => setTimeout(resolve, 1000)); // Rate limiting
       }
     }
   };
@@ -103,7 +104,7 @@ const ReviewSummaryPage = () => {
                 )}
               </div>
 
-              {loadingSummary[hotel.id] && (
+              {loadingSummary[hotel.id] && !summaries[hotel.id] && (
                 <div style={{ 
                   padding: '1.5rem', 
                   textAlign: 'center', 
@@ -136,8 +137,14 @@ const ReviewSummaryPage = () => {
                     paddingTop: '1rem',
                     borderTop: '1px solid #dee2e6'
                   }}>
-                    📊 {summaries[hotel.id].processed_reviews} of {summaries[hotel.id].total_reviews} reviews analyzed
-                    {summaries[hotel.id].model_used && ` • 🤖 ${summaries[hotel.id].model_used}`}
+                    {summaries[hotel.id].streaming ? (
+                      '✍️ Generating...'
+                    ) : (
+                      <>
+                        📊 {summaries[hotel.id].processed_reviews} of {summaries[hotel.id].total_reviews} reviews analyzed
+                        {summaries[hotel.id].model_used && ` • 🤖 ${summaries[hotel.id].model_used}`}
+                      </>
+                    )}
                   </div>
                 </div>
               )}
@@ -11,15 +11,21 @@ const api = axios.create({
 
 // Hotels API
 export const hotelService = {
-  // Get all hotels
-  getAllHotels: async () => {
-    const response = await api.get('/hotels');
+  // Get all hotels (only the given fields, e.g. 'name,location', when set)
+  getAllHotels: async (fields) => {
+    const response = await api.get('/hotels', { params: fields ? { fields } : {} });
     return response.data;
   },
 
   // Get hotel by ID with reviews
   getHotelById: async (id) => {
-    const response = await api.get(`/hotels/${id}`);
+    const response = await api.get(`/hotels/${id}`, {
+      params: {
+        fields: 'name,location,description,average_sentiment,total_reviews',
+        include: 'reviews',
+        review_fields: 'reviewer_name,review_text,sentiment_label,sentiment_score,created_at',
+      },
+    });
     return response.data;
   },
 };
@@ -54,6 +60,62 @@ export const summarizationService = {
     const response = await api.post('/summarize', requestData);
     return response.data;
   },
+
+  // Queue a background summarization job
+  createSummaryJob: async (hotelId, options = {}) => {
+    const requestData = {
+      hotel_id: hotelId,
+      max_length: options.maxLength || 100,
+      min_length: options.minLength || 20
+    };
+    const response = await api.post('/summarize/jobs', requestData);
+    return response.data;
+  },
+
+  // Get the status and result of a summarization job
+  getSummaryJob: async (jobId) => {
+    const response = await api.get(`/summarize/jobs/${jobId}`);
+    return response.data;
+  },
+
+  // Stream a hotel's summary as it is generated; onText receives the text so far
+  streamSummary: (hotelId, options = {}) =>
+    new Promise((resolve, reject) => {
+      const params = new URLSearchParams({
+        hotel_id: hotelId,
+        max_length: options.maxLength || 100,
+        min_length: options.minLength || 20
+      });
+      const source = new EventSource(`${API_BASE_URL}/summarize/stream?${params}`);
+      let text = '';
+      source.addEventListener('token', (event) => {
+        text += JSON.parse(event.data).text;
+        if (options.onText) options.onText(text);
+      });
+      source.addEventListener('done', (event) => {
+        source.close();
+        resolve(JSON.parse(event.data));
+      });
+      source.onerror = () => {
+        // Closing also stops EventSource from reconnecting and starting a new generation
+        source.close();
+        reject(new Error('Summary stream failed'));
+      };
+    }),
+
+  // Queue a job for a hotel and poll until its summary is ready
+  summarizeReviewsInBackground: async (hotelId, options = {}) => {
+    const pollInterval = options.pollInterval || 1000;
+    let job = await summarizationService.createSummaryJob(hotelId, options);
+    while (job.status === 'PENDING' || job.status === 'RUNNING') {
+      await new Promise(resolve => setTimeout(resolve, pollInterval));
+      job = await summarizationService.getSummaryJob(job.job_id);
+    }
+    if (job.status === 'FAILED') {
+      throw new Error(job.error || 'Summarization job failed');
+    }
+    return job.result;
+  },
 };
 
 export default api;